@@ -1,4 +1,5 @@
 import networkx as nx
+import numpy as np
 from itertools import combinations
 from collections import defaultdict, deque
 from cgshop2026_pyutils.io import read_instance
@@ -7,251 +8,158 @@ from cgshop2026_pyutils.schemas import CGSHOP2026Instance
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 
-from helpFuncs import normalize_edge,new_triangles
+from helpFuncs import normalize_edge,new_triangles,schedule_pairs
+from edge_universe import EdgeUniverse
 
-class ConnectedDirectedComponent:
-    def __init__(self, initial_node=None):
-        self.graph = defaultdict(set)
-        self.reverse_graph = defaultdict(set)
-        self.nodes = set()
-        self._heads = set()
-        
-        # Initialize with one node if provided
-        if initial_node is not None:
-            self.nodes.add(initial_node)
-            self._heads.add(initial_node)
-    def get_layers_topological(self) -> list[list[tuple]]:
-        """
-        Returns layers where a node only appears after ALL its dependencies 
-        (parents) have been processed. This guarantees valid parallel execution.
-        """
-        # 1. Calculate In-Degrees for all nodes
-        in_degree = {node: 0 for node in self.nodes}
-        for u in self.graph:
-            for v in self.graph[u]:
-                in_degree[v] += 1
-        
-        # 2. Layer 0 starts with nodes that have NO dependencies (Heads)
-        current_layer = [n for n in self.nodes if in_degree[n] == 0]
-        layers = []
-        
-        # 3. Process layer by layer
-        while current_layer:
-            layers.append(current_layer)
+class FlipDAG:
+    """
+    Dependency graph of flips with add_node/add_edge/get_all_components. Nodes get
+    int ids in insertion order (labels keep the caller's node, e.g. the
+    (Edge_Before, Edge_After, Unique_Index) tuples of MakeComponents), edges go to
+    two flat lists and components are a union-find by size, so a merge is O(1).
+    The CSR adjacency (duplicate edges dropped) and the Kahn layer of every node
+    are built once, when they are first read.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self.ids = {}
+        self.src = []
+        self.dst = []
+        self.parent = []
+        self.size = []
+        self._built = None
+
+    def add_node(self, node) -> int:
+        i = self.ids.get(node)
+        if i is None:
+            i = len(self.labels)
+            self.labels.append(node)
+            self.ids[node] = i
+            self.parent.append(i)
+            self.size.append(1)
+            self._built = None
+        return i
+
+    def find(self, i: int) -> int:
+        parent = self.parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def add_edge(self, u, v):
+        iu, iv = self.add_node(u), self.add_node(v)
+        self.src.append(iu)
+        self.dst.append(iv)
+        ru, rv = self.find(iu), self.find(iv)
+        if ru != rv:
+            # הקטן מצטרף לגדול
+            if self.size[ru] < self.size[rv]:
+                ru, rv = rv, ru
+            self.parent[rv] = ru
+            self.size[ru] += self.size[rv]
+        self._built = None
+
+    def csr(self) -> tuple[np.ndarray, np.ndarray]:
+        """(indptr, indices): the children of node i are indices[indptr[i]:indptr[i + 1]]."""
+        n = len(self.labels)
+        keys = np.unique(np.array(self.src, dtype=np.int64) * n + np.array(self.dst, dtype=np.int64))
+        src, dst = keys // max(n, 1), keys % max(n, 1)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return indptr, dst
+
+    def depths(self) -> np.ndarray:
+        """Kahn layer of every node: a node comes one layer after its last parent."""
+        indptr, indices = self.csr()
+        indptr, children = indptr.tolist(), indices.tolist()
+        in_degree = np.bincount(indices, minlength=len(self.labels)).tolist()
+        depth = [0] * len(self.labels)
+        current = [i for i, d in enumerate(in_degree) if d == 0]
+        d = 0
+        while current:
             next_layer = []
-            
-            for u in current_layer:
-                # 'u' is done. Now notify its children.
-                for v in self.graph[u]:
+            for u in current:
+                depth[u] = d
+                for v in children[indptr[u]:indptr[u + 1]]:
                     in_degree[v] -= 1
-                    # Only add 'v' if ALL its parents are done
                     if in_degree[v] == 0:
                         next_layer.append(v)
-            
-            current_layer = next_layer
-            
-        return layers
-    def add_edge_internal(self, u, v):
-        """
-        Adds edge logic WITHOUT checking for merges. 
-        (Used internally by the Manager).
-        """
-        # 1. Update Sets
-        self.graph[u].add(v)
-        self.reverse_graph[v].add(u)
-        self.nodes.add(u)
-        self.nodes.add(v)
-
-        # 2. Update Heads Logic
-        # If v is in heads, remove it (it now has a parent)
-        if v in self._heads:
-            self._heads.remove(v)
-        
-        # If u is new to this component (and not in reverse_graph), it's a head
-        # (Though usually the Manager handles the creation of U/V before calling this)
-        if u not in self.reverse_graph:
-            self._heads.add(u)
-
-    def merge(self, other: 'ConnectedDirectedComponent'):
-        """
-        Absorbs 'other' component into 'self'.
-        """
-        # 1. Merge Nodes
-        self.nodes.update(other.nodes)
-        
-        # 2. Merge Edges (Forward)
-        for u, neighbors in other.graph.items():
-            self.graph[u].update(neighbors)
-            
-        # 3. Merge Edges (Backward)
-        for v, parents in other.reverse_graph.items():
-            self.reverse_graph[v].update(parents)
-            
-        # 4. Merge Heads
-        # (We will fix specific invalid heads when the connecting edge is added later)
-        self._heads.update(other._heads)
+            current = next_layer
+            d += 1
+        return np.array(depth, dtype=np.int64)
 
-    def get_heads(self):
-        return self._heads
-        
-    def __repr__(self):
-        return f"<Component Nodes: {len(self.nodes)}, Heads: {self._heads}>"
-    def get_layers_of_nodes(self) -> list[list[tuple[int, int]]]:
-        """
-        Returns a list of lists.
-        Index 0 contains the Head Flips (Layer 0).
-        Index 1 contains flips enabled by Layer 0, etc.
-        """
-        if not self._heads:
-            return []
+    def _build(self):
+        if self._built is None:
+            depth = self.depths()
+            members = defaultdict(list)
+            for i in range(len(self.labels)):
+                members[self.find(i)].append(i)
+            self._built = {root: FlipDAGComponent(self, ids, depth) for root, ids in members.items()}
+        return self._built
 
-        layers = []
-        
-        # Initialize with all heads
-        current_layer_nodes = list(self._heads)
-        visited_nodes = set(self._heads)
-        
-        while current_layer_nodes:
-            # 1. Add the FLIPS themselves to the result
-            layers.append(current_layer_nodes)
+    def get_all_components(self) -> list['FlipDAGComponent']:
+        return list(self._build().values())
 
-            next_layer_nodes = []
-            
-            for u in current_layer_nodes:
-                # Get all dependent flips (children)
-                for v in self.graph[u]:
-                    if v not in visited_nodes:
-                        visited_nodes.add(v)
-                        next_layer_nodes.append(v)
-            
-            # Move to next layer
-            current_layer_nodes = next_layer_nodes
-            
-        return layers
-    def get_layers_as_edges(self) -> list[list[tuple]]:
-        """
-        Returns a list of lists.
-        Index 0 contains edges from the Heads (Layer 0 to Layer 1).
-        Index 1 contains edges from Layer 1 to Layer 2, etc.
-        """
-        if not self._heads:
-            return []
+    def get_component(self, node):
+        i = self.ids.get(node)
+        return None if i is None else self._build()[self.find(i)]
+
+
+class FlipDAGComponent:
+    """One component of a FlipDAG, read-only: nodes, graph, heads and Kahn layers."""
 
+    def __init__(self, dag: FlipDAG, ids: list[int], depth: np.ndarray):
+        self.dag = dag
+        self.ids = ids
+        self.depth = depth
+
+    @property
+    def nodes(self) -> set:
+        return {self.dag.labels[i] for i in self.ids}
+
+    @property
+    def graph(self) -> dict:
+        labels = self.dag.labels
+        indptr, indices = self.dag.csr()
+        return {labels[u]: {labels[v] for v in indices[indptr[u]:indptr[u + 1]]} for u in self.ids}
+
+    def get_heads(self) -> set:
+        return {self.dag.labels[i] for i in self.ids if self.depth[i] == 0}
+
+    def get_layers_topological(self) -> list[list[tuple]]:
+        """Same layers as ConnectedDirectedComponent.get_layers_topological."""
         layers = []
-        
-        # Initialize with all heads
-        current_layer_nodes = list(self._heads)
-        visited_nodes = set(self._heads)
-        
-        while current_layer_nodes:
-            next_layer_nodes = []
-            current_layer_edges = []
-            
-            for u in current_layer_nodes:
-                # Get all outgoing neighbors
-                for v in self.graph[u]:
-                    # We add the edge to the current layer
-                    current_layer_edges.append((u, v))
-                    
-                    # If v hasn't been visited, it will be the start of the next layer
-                    if v not in visited_nodes:
-                        visited_nodes.add(v)
-                        next_layer_nodes.append(v)
-            
-            # If we found edges in this layer, add them to the result
-            if current_layer_edges:
-                layers.append(current_layer_edges)
-            
-            # Move to next layer
-            current_layer_nodes = next_layer_nodes
-            
+        for i in self.ids:
+            d = int(self.depth[i])
+            while len(layers) <= d:
+                layers.append([])
+            layers[d].append(self.dag.labels[i])
         return layers
-class DynamicGraphManager:
-    def __init__(self):
-        # Maps Node ID -> Component Instance
-        self.node_map = {}
-        # Keep track of unique component objects
-        self.components = set()
-    def get_all_components(self) -> list['ConnectedDirectedComponent']:
-            """Returns a list of all active connected components."""
-            return list(self.components)
-    def add_node(self, node):
-        """
-        Adds a single isolated node (flip) to the graph.
-        If the node already exists, it does nothing.
-        """
-        if node not in self.node_map:
-            # Create a new component containing ONLY this one flip
-            new_comp = ConnectedDirectedComponent(node)
-            self.components.add(new_comp)
-            self.node_map[node] = new_comp
-    def add_edge(self, u, v):
-        # Case 1: Both nodes are new
-        if u not in self.node_map and v not in self.node_map:
-            new_comp = ConnectedDirectedComponent(u)
-            # v will be added by add_edge_internal
-            self.components.add(new_comp)
-            self.node_map[u] = new_comp
-            self.node_map[v] = new_comp
-            new_comp.add_edge_internal(u, v)
-
-        # Case 2: u is old, v is new
-        elif u in self.node_map and v not in self.node_map:
-            comp = self.node_map[u]
-            self.node_map[v] = comp
-            comp.add_edge_internal(u, v)
-
-        # Case 3: u is new, v is old
-        elif u not in self.node_map and v in self.node_map:
-            comp = self.node_map[v]
-            self.node_map[u] = comp
-            comp.add_edge_internal(u, v)
-
-        # Case 4: Both exist (The Merge Scenario)
-        else:
-            comp_u = self.node_map[u]
-            comp_v = self.node_map[v]
-
-            if comp_u is not comp_v:
-                # MERGE DETECTED!
-                # We merge v into u (arbitrary choice)
-                #print(f"Merging component of {v} into component of {u}...")
-                
-                # 1. Perform the data merge
-                comp_u.merge(comp_v)
-                
-                # 2. Update the pointer map for all nodes in the old component
-                for node in comp_v.nodes:
-                    self.node_map[node] = comp_u
-                
-                # 3. Remove the old component object
-                self.components.remove(comp_v)
-                
-                # 4. Finally add the connecting edge
-                comp_u.add_edge_internal(u, v)
-            else:
-                # They are already in the same component, just add edge
-                comp_u.add_edge_internal(u, v)
-        
-    def get_component(self, node):
-        return self.node_map.get(node)
+
+    def __repr__(self):
+        return f"<Component Nodes: {len(self.ids)}, Heads: {self.get_heads()}>"
+
+
 def MakeComponents(a: FlippableTriangulation,
-                   stages_of_flips: list[list[tuple[int, int]]]):
+                   stages_of_flips: list[list[tuple[int, int]]],
+                   universe: EdgeUniverse = None):
     
-    AllComponents = DynamicGraphManager()
+    AllComponents = FlipDAG()
+    U = universe if universe is not None else EdgeUniverse()
     
     # We maintain ONE working triangulation that moves forward in time.
     # This guarantees we never get "ValueError: Edge not flippable".
     a_working = a.fork()
     
-    # MEMORY: Maps an active edge on the board -> The Node ID that created it.
+    # MEMORY: Maps an active edge id on the board -> The Node ID that created it.
     # This replaces the need to re-simulate components to find dependencies.
     edge_creator_map = {}
     
     # Initialize creator map with "ORIGINAL" for initial edges
     for edge in a.get_edges():
-        norm_edge = normalize_edge(*edge)
-        edge_creator_map[norm_edge] = "ORIGINAL"
+        edge_creator_map[U.intern(*edge)] = "ORIGINAL"
 
     # Global counter to enforce uniqueness for every single flip operation (handles cycles)
     global_flip_id = 0
@@ -260,12 +168,11 @@ def MakeComponents(a: FlippableTriangulation,
         for e in FlipList:
             
             e = normalize_edge(*e)
-            if e == (9,30):
-                print(a_working.get_flip_partner(e))
-
+            e_id = U.intern(*e)
             
             # We calculate the partner edge to use in the ID
             partner = normalize_edge(*a_working.get_flip_partner(e))
+            partner_id = U.intern(*partner)
             
             # format: (Edge_Before, Edge_After, Unique_Index)
             current_id = (e, partner, global_flip_id)
@@ -275,18 +182,17 @@ def MakeComponents(a: FlippableTriangulation,
             AllComponents.add_node(current_id)
 
             
-            if e in edge_creator_map:
-                creator = edge_creator_map[e]
+            if e_id in edge_creator_map:
+                creator = edge_creator_map[e_id]
                 if creator != "ORIGINAL":
                     AllComponents.add_edge(creator, current_id)
             
             
             t1, t2 = new_triangles(a_working, e)
-            raw_affecting = set(t1 + t2)
-            affecting_edges = {normalize_edge(*edge) for edge in raw_affecting}
+            affecting_edges = {U.intern(*edge) for edge in t1 + t2}
             
             # only the ones who affect the possiblity of it to flip
-            relevant_edges = affecting_edges - {partner}
+            relevant_edges = affecting_edges - {partner_id}
 
           
 
@@ -307,11 +213,11 @@ def MakeComponents(a: FlippableTriangulation,
                 
                 
                 # The new edge (partner) is created by THIS specific node
-                edge_creator_map[partner] = current_id
+                edge_creator_map[partner_id] = current_id
                 
                 # The old edge (e) is gone, remove it to keep map clean
-                if e in edge_creator_map:
-                    del edge_creator_map[e]
+                if e_id in edge_creator_map:
+                    del edge_creator_map[e_id]
 
             except ValueError:
                 print(f"    failed flip {e}")
@@ -335,47 +241,186 @@ def FlipInThisTriangulation(a: FlippableTriangulation, e_before: tuple,e_after:
 
 
 
-def fromCompToFlips(a: FlippableTriangulation,stages_of_flips):
-            a_clone2 = a.fork()
-            stages_of_flips_comp = list(list())
-            manager = MakeComponents(a, stages_of_flips)
-            
-            # 1. Gather all layers from all components into a single 'Global' list of layers
-            # global_layers[0] will hold Layer 0 from Comp A, Layer 0 from Comp B, etc.
-            global_layers = []
+def list_schedule(a: FlippableTriangulation, stages_of_flips, universe: EdgeUniverse = None):
+    """
+    Reschedules the flips of stages_of_flips into fewer layers with greedy list
+    scheduling. This is a heuristic: with the triangle conflicts inside a layer the
+    result is not guaranteed to have the minimum number of layers.
+
+    Dependencies are taken per triangle instance: a flip consumes the two triangles
+    around its edge and produces the two around its partner, and has to run after the
+    flips that produced the triangles it consumes. This covers both the edge creators
+    of MakeComponents and the "read before the quad changes" order, and any layering
+    that respects it is a valid schedule of the same flips.
+    Ready flips are packed layer by layer, longest remaining path (critical path)
+    first; a flip that add_flip still rejects in its layer is deferred to the next
+    layer, never dropped. Flips that already fail in the input schedule are left out.
+    The result is replayed against the input before it is returned; this checks that
+    it reaches the same triangulation, not its layer count.
+    Returns (dist, stages_of_flips, deferred).
+    """
+    U = universe if universe is not None else EdgeUniverse()
+
+    # 1. הרצה לפי הסדר המקורי: לכל היפוך - מי יצר את המשולשים שהוא צורך
+    sequential = a.fork()
+    producer = {}
+    flips = []
+    parents = []
+    for FlipList in stages_of_flips:
+        layer = []
+        for e in FlipList:
+            e = normalize_edge(*e)
+            try:
+                v, z = sequential.get_flip_partner(e)
+                sequential.add_flip(e)
+            except ValueError:
+                continue
+            u, w = e
+            layer.append((e, (v, z)))
+            flips.append(e)
+            U.intern(*e)
+            parents.append({producer.get(t) for t in (frozenset((u, w, v)), frozenset((u, w, z)))} - {None})
+        sequential.commit()
+        for k, (e, (v, z)) in enumerate(layer):
+            i = len(flips) - len(layer) + k
+            u, w = e
+            producer[frozenset((v, z, u))] = i
+            producer[frozenset((v, z, w))] = i
+
+    n = len(flips)
+    dag = FlipDAG()
+    for i, ps in enumerate(parents):
+        dag.add_node(i)
+        for p in ps:
+            dag.add_edge(p, i)
+    indptr, indices = dag.csr()
+    indptr, indices = indptr.tolist(), indices.tolist()
+    children = [indices[indptr[i]:indptr[i + 1]] for i in range(n)]
+    # הדרך הארוכה ביותר עד הסוף (עדיפות של נתיב קריטי); הורה תמיד לפני הילד
+    priority = [1] * n
+    for i in reversed(range(n)):
+        for c in children[i]:
+            priority[i] = max(priority[i], priority[c] + 1)
+
+    # 2. תזמון לפי רשימה
+    missing = [len(ps) for ps in parents]
+    ready = [i for i in range(n) if missing[i] == 0]
+    working = a.fork()
+    stages = []
+    deferred = 0
+    while ready:
+        ready.sort(key=lambda i: (-priority[i], i))
+        placed = []
+        waiting = []
+        for i in ready:
+            try:
+                working.add_flip(flips[i])
+                placed.append(i)
+            except ValueError:
+                waiting.append(i)
+        if not placed:
+            raise ValueError("list_schedule: no ready flip can be placed")
+        deferred += len(waiting)
+        working.commit()
+        stages.append([flips[i] for i in placed])
+        for i in placed:
+            for c in children[i]:
+                missing[c] -= 1
+                if missing[c] == 0:
+                    waiting.append(c)
+        ready = waiting
+
+    # 3. אימות מול ההרצה המקורית
+    if {normalize_edge(*e) for e in working.get_edges()} != {normalize_edge(*e) for e in sequential.get_edges()}:
+        raise ValueError("list_schedule: the new schedule does not reach the same triangulation")
+    return len(stages), stages, deferred
+
+
+def remove_redundant_flips(a: FlippableTriangulation, flips_with_partner_by_layer, universe: EdgeUniverse = None):
+    """
+    Removes flips that cancel out and reschedules the rest (list_schedule).
+    Two kinds are found, over the flips in their input order:
+    * a flip f -> e that consumes exactly the two triangles made by an earlier e -> f -
+      nothing in between touched them, so both flips go (repeatedly, so walks that
+      retrace their steps collapse completely);
+    * a stretch of flips after which the triangulation is the same as before it
+      (state hash = edge bitset of the universe, updated by xor per flip).
+    The result is replayed and must reach the same triangulation as the input,
+    otherwise the input is returned unchanged.
+    Returns (dist, flips_by_layer, flips_with_partner_by_layer, removed).
+    """
+    U = universe if universe is not None else EdgeUniverse()
+    sequence = [(normalize_edge(*e), normalize_edge(*f)) for layer in flips_with_partner_by_layer
+                for e, f in sorted(layer)]
+    original = len(sequence)
+
+    changed = True
+    while changed:
+        changed = False
+        # 1. היפוך והיפוך חזרה על אותם שני משולשים
+        producer = {}
+        saved = {}
+        alive = set()
+        for k, (e, f) in enumerate(sequence):
+            (u, w), (v, z) = e, f
+            consumed = (frozenset((u, w, v)), frozenset((u, w, z)))
+            produced = (frozenset((v, z, u)), frozenset((v, z, w)))
+            before = tuple(producer.pop(t, None) for t in consumed)
+            x = before[0]
+            if x is not None and x == before[1] and sequence[x] == (f, e):
+                # x ו-k מתבטלים: המשולשים ש-x צרך חוזרים עם היוצרים שלהם
+                alive.discard(x)
+                for t, old in zip(produced, saved.pop(x)):
+                    if old is not None:
+                        producer[t] = old
+                changed = True
+                continue
+            saved[k] = before
+            for t in produced:
+                producer[t] = k
+            alive.add(k)
+        sequence = [sequence[k] for k in sorted(alive)]
+
+        # 2. קטע שמחזיר את הטריאנגולציה לאותו מצב
+        key = 0
+        seen = {0: 0}
+        out = []
+        for e, f in sequence:
+            key ^= (1 << U.intern(*e)) ^ (1 << U.intern(*f))
+            out.append((e, f))
+            if key in seen:
+                del out[seen[key]:]
+                changed = True
+                seen = {k: i for k, i in seen.items() if i <= len(out)}
+            else:
+                seen[key] = len(out)
+        sequence = out
+
+    try:
+        dist, flips_by_layer, _ = list_schedule(a, [[e] for e, _ in sequence], U)
+        pairs = schedule_pairs(a, flips_by_layer)
+        target = a.fork()
+        for layer in flips_with_partner_by_layer:
+            for e, _ in layer:
+                target.add_flip(e)
+            target.commit()
+        result = a.fork()
+        for layer in flips_by_layer:
+            for e in layer:
+                result.add_flip(e)
+            result.commit()
+        if set(result.get_edges()) != set(target.get_edges()):
+            raise ValueError("not the same triangulation")
+    except ValueError:
+        return (len(flips_with_partner_by_layer), [{e for e, _ in layer} for layer in flips_with_partner_by_layer],
+                flips_with_partner_by_layer, 0)
+    return dist, [set(layer) for layer in flips_by_layer], pairs, original - len(sequence)
 
-            for comp in manager.get_all_components():
-                comp_layers = comp.get_layers_topological()
-                
-                for depth, layer in enumerate(comp_layers):
-                    # Ensure the global list is deep enough
-                    while len(global_layers) <= depth:
-                        global_layers.append([])
-                    
-                    # Merge this component's layer into the global layer at the same depth
-                    global_layers[depth].extend(layer)
-
-            # 2. Execute the Global Layers sequentially
-           # print(f"  new dist after comp: {len(global_layers)}")
-            dist_comp = len(global_layers)
-            for i, layer in enumerate(global_layers):
-                # print(f"Processing Global Layer {i} with {len(layer)} flips...")
-                stages_of_flips_comp.append(list())
-                
-                for node_id in layer:
-                    # node_id is (Edge_Before, Edge_After, ID)
-                    edge_to_flip = node_id[0]
-                    
-                    try:
-                        a_clone2.add_flip(edge_to_flip)
-                        # FIX: Use 'i' (the index) instead of 'layer' (the list object)
-                        stages_of_flips_comp[i].append(edge_to_flip) 
-                    except ValueError:
-                        # This catches edges that might conflict within the same batch
-                        # (Though topological sort usually prevents this for dependencies)
-                        pass
-                
-                # Commit AFTER processing the full layer (All components advance together)
-                a_clone2.commit()
 
-            return dist_comp , stages_of_flips_comp
\ No newline at end of file
+def fromCompToFlips(a: FlippableTriangulation,stages_of_flips, universe: EdgeUniverse = None):
+    """
+    Compresses a schedule: same flips, usually fewer layers (greedy, see list_schedule).
+    Returns (dist, stages_of_flips).
+    """
+    dist_comp, stages_of_flips_comp, _ = list_schedule(a, stages_of_flips, universe)
+    return dist_comp, stages_of_flips_comp
@@ -1,11 +1,12 @@
 import networkx as nx
-from itertools import combinations
 from collections import defaultdict, deque
 from cgshop2026_pyutils.io import read_instance
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
+from edge_universe import EdgeUniverse
+from helpFuncs import quad_edges
 def normalize_edge(u, v):
     """Return the edge in a canonical form (smallest vertex first)."""
     return (min(u, v), max(u, v))
@@ -15,11 +16,15 @@ class DSU:
         self.parent = {}
 
     def find(self, x):
-        if x not in self.parent:
-            self.parent[x] = x
-        if self.parent[x] != x:
-            self.parent[x] = self.find(self.parent[x])
-        return self.parent[x]
+        parent = self.parent
+        if x not in parent:
+            parent[x] = x
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
 
     def union(self, x, y):
         px = self.find(x)
@@ -32,133 +37,85 @@ class DSU:
             self.parent[x] = x
 
 
-def build_flip_components(layers, a: FlippableTriangulation, max_subset_size=5):
+def build_flip_components(layers, a: FlippableTriangulation, universe: EdgeUniverse = None,
+                          verbose: bool = False):
     """
     בונה קומפוננטות flips עם תלות ביניהן.
-    
+
+    The flips that enable a flip are read off the local geometry: the previous-layer
+    flips whose created edge is one of the five edges of this flip's quadrilateral
+    (its diagonal or a side), i.e. exactly the flips that made one of its two
+    triangles. O(1) per flip with a dict from created edge to flip, no subset search.
+
     Args:
         layers: list של sets של tuples (edge, flip_partner)
         a: טרינגולציה התחלתית (FlippableTriangulation)
-        max_subset_size: גודל מקסימלי של subset לבדיקה
-    
+        universe: EdgeUniverse of the instance (a fresh one if omitted)
+        verbose: print every flip and its enabling flips
+
     Returns:
         dsu: DSU structure with connected components
-        comp_info: dict with info about each node
+        comp_info: dict with info about each node; nodes are (edge_id, layer) and
+                   info holds "edge" (tuple), "edge_id", "layer" and "enabled" (edge ids)
         Trings: list of triangulations after each layer
     """
+    U = universe if universe is not None else EdgeUniverse()
     dsu = DSU()
     comp_info = {}
     Trings = [a]  # Trings[0] = טרינגולציה מקורית, Trings[i] = אחרי שכבה i-1
-    
-    all_executed_flips = []  # all_executed_flips[i] = flips בשכבה i
+    created_by = {}  # id של קשת שנוצרה בשכבה הקודמת -> id של הקשת שהיפוכה יצר אותה
 
     # עיבוד כל שכבה
     for layer_idx, current_layer in enumerate(layers):
-        print(f"\n{'='*60}")
-        print(f"Processing Layer {layer_idx}")
-        print(f"{'='*60}")
-        
+        if verbose:
+            print(f"\n{'='*60}")
+            print(f"Processing Layer {layer_idx}")
+            print(f"{'='*60}")
+
         # התחלה מהטרינגולציה אחרי השכבה הקודמת
         a_current = Trings[-1].fork()
         current_layer_flips = []
-        
-        # רשימת הצלעות מהשכבה הקודמת בלבד (לא מכל ההיסטוריה)
-        prev_layer_edges = all_executed_flips[-1] if layer_idx > 0 else []
+        created_now = {}
 
         for edge, e_flip in current_layer:
             edge = normalize_edge(*edge)
             e_flip = normalize_edge(*e_flip)
-            node = (edge, layer_idx)
+            edge_id = U.intern(*edge)
+            node = (edge_id, layer_idx)
             dsu.add(node)
-            
-            print(f"\n--- Edge {edge} ---")
-            
-            # 🔴 בדיקה 1: האם זה independent flip מהטרינגולציה המקורית?
-            if edge in a.possible_flips() and normalize_edge(*a.get_flip_partner(edge)) == e_flip:
-                comp_info[node] = {"edge": edge, "layer": layer_idx, "enabled": set()}
-                print(f"✓ Independent flip from base triangulation")
-                try:
-                    a_current.add_flip(edge)
-                    current_layer_flips.append(edge)
-                except ValueError as e:
-                    print(f"✗ Failed: {e}")
-                continue
-            
-            # 🔴 בדיקה 2: חיפוש subset מינימלי מהשכבה הקודמת
-            if layer_idx == 0:
-                # שכבה ראשונה - אין תלויות
-                comp_info[node] = {"edge": edge, "layer": layer_idx, "enabled": set()}
-                print(f"✓ Layer 0 - no dependencies")
-                try:
-                    a_current.add_flip(edge)
-                    current_layer_flips.append(edge)
-                except ValueError as e:
-                    print(f"✗ Failed: {e}")
-                continue
-            
-            # חיפוש subset מינימלי
-            found_dependency_set = set()
-            found = False
-            
-            print(f"Searching for minimal subset from prev layer ({len(prev_layer_edges)} edges)...")
-            
-            # 🔴 מפתח: מתחילים מהטרינגולציה לפני השכבה הקודמת!
-            base_for_search = Trings[-2].fork() if layer_idx > 1 else a.fork()
-            
-            for size in range(1, min(len(prev_layer_edges) + 1, max_subset_size + 1)):
-                if found:
-                    break
-                
-                tested = 0
-                for subset in combinations(prev_layer_edges, size):
-                    tested += 1
-                    a_dup = base_for_search.fork()
-                    try:
-                        for prev_edge in subset:
-                            a_dup.add_flip(prev_edge)
-                        a_dup.commit()
-                        
-                        if edge in a_dup.possible_flips() and normalize_edge(*a_dup.get_flip_partner(edge)) == e_flip:
-                            found_dependency_set = set(subset)
-                            found = True
-                            print(f"✓ Found minimal subset of size {size}: {subset}")
-                            break
-                    except ValueError:
-                        continue
-                
-                if tested > 0 and not found:
-                    print(f"  Tested {tested} subsets of size {size} - none worked")
-
-            # שמירת מידע
-            comp_info[node] = {"edge": edge, "layer": layer_idx, "enabled": found_dependency_set}
-            
-            if not found:
-                print(f"⚠ No enabling subset found (may need larger max_subset_size)")
-            
-            # יוניון עם הפליפים שנמצאו
-            for dep_edge in found_dependency_set:
+
+            # מי מהשכבה הקודמת יצר קשת במרובע של ההיפוך הזה
+            enabled = set()
+            for x in quad_edges(edge, e_flip):
+                creator = created_by.get(U.intern(*x))
+                if creator is not None:
+                    enabled.add(creator)
+            comp_info[node] = {"edge": edge, "edge_id": edge_id, "layer": layer_idx, "enabled": enabled}
+            for dep_edge in enabled:
                 dep_node = (dep_edge, layer_idx - 1)
                 dsu.add(dep_node)
                 dsu.union(node, dep_node)
+            if verbose:
+                print(f"--- Edge {edge}: enabled by {sorted(U.edge(x) for x in enabled)}")
 
             # הוספה לטרינגולציה
             try:
                 a_current.add_flip(edge)
                 current_layer_flips.append(edge)
-                print(f"✓ Flip added successfully")
+                created_now[U.intern(*e_flip)] = edge_id
             except ValueError as e:
-                print(f"✗ Failed to add flip: {e}")
+                if verbose:
+                    print(f"✗ Failed to add flip: {e}")
 
         a_current.commit()
         Trings.append(a_current)
-        all_executed_flips.append(current_layer_flips)
-        
-        print(f"\n✓ Layer {layer_idx} completed: {len(current_layer_flips)}/{len(current_layer)} flips succeeded")
-        
+        created_by = created_now
+
+        if verbose:
+            print(f"\n✓ Layer {layer_idx} completed: {len(current_layer_flips)}/{len(current_layer)} flips succeeded")
         # 🔴 אזהרה אם לא הצלחנו להוסיף אף flip בשכבה
-        if len(current_layer_flips) == 0:
+        if len(current_layer_flips) == 0 and current_layer:
             print(f"⚠️ WARNING: No flips succeeded in layer {layer_idx}!")
-            print(f"   This layer will not appear in the dependency graph.")
             print(f"   Edges attempted: {[normalize_edge(*e[0]) for e in current_layer]}")
 
     return dsu, comp_info, Trings
@@ -184,7 +141,7 @@ def visualize_flip_components(comp_info, show_all=True):
         for dep_flip in info["enabled"]:
             dep_node = None
             for n, n_info in comp_info.items():
-                if n_info["edge"] == dep_flip and n_info["layer"] == info["layer"] - 1:
+                if n_info["edge_id"] == dep_flip and n_info["layer"] == info["layer"] - 1:
                     dep_node = n
                     break
             if dep_node:
@@ -310,7 +267,7 @@ def visualize_components(dsu, comp_info, Trings, final_edges=None, stages_of_fli
             dep_node = None
             target_layer = info["layer"] - 1
             for cand in comp_info.keys():
-                if comp_info[cand]["edge"] == dep and comp_info[cand]["layer"] == target_layer:
+                if comp_info[cand]["edge_id"] == dep and comp_info[cand]["layer"] == target_layer:
                     dep_node = cand
                     break
             if dep_node:
@@ -318,10 +275,11 @@ def visualize_components(dsu, comp_info, Trings, final_edges=None, stages_of_fli
 
     # קשתות משותפות
     if stages_of_flips_with_partner is not None:
+        edge_ids = {info["edge"]: info["edge_id"] for info in comp_info.values()}
         for layer_idx, flips in enumerate(stages_of_flips_with_partner):
             for edge, partner in flips:
-                n1 = (tuple(sorted(edge)), layer_idx)
-                n2 = (tuple(sorted(partner)), layer_idx)
+                n1 = (edge_ids.get(tuple(sorted(edge))), layer_idx)
+                n2 = (edge_ids.get(tuple(sorted(partner))), layer_idx)
                 if n1 in G.nodes() and n2 in G.nodes():
                     G.add_edge(n1, n2)
 
@@ -455,11 +413,13 @@ def optimize_flip_sequence(comp_info, original_layers):
     if sample_nodes:
         print(f"   Type: {type(sample_nodes[0])}, parts: {sample_nodes[0]}")
     
-    # בניית מיפוי: edge -> שכבות בהן הוא מופיע
+    # בניית מיפוי: edge id -> שכבות בהן הוא מופיע
     edge_to_layers = defaultdict(list)
+    edge_ids = {}
     for node, info in comp_info.items():
-        edge, layer = node
-        edge_to_layers[edge].append(layer)
+        edge_id, layer = node
+        edge_to_layers[edge_id].append(layer)
+        edge_ids[info["edge"]] = edge_id
     
     print(f"\n   Total unique edges in comp_info: {len(edge_to_layers)}")
     
@@ -524,14 +484,15 @@ def optimize_flip_sequence(comp_info, original_layers):
     for original_layer_idx, layer_set in enumerate(original_layers):
         for edge, partner in layer_set:
             # נסה למצוא את ה-node המתאים
-            node = (edge, original_layer_idx)
+            edge_id = edge_ids.get(normalize_edge(*edge))
+            node = (edge_id, original_layer_idx)
             
             if node in node_to_shift:
                 # אופטימיזציה: הזז לפי הקומפוננטה
                 shift = node_to_shift[node]
                 new_layer_idx = original_layer_idx - shift
                 processed_optimized += 1
-            elif edge in edge_to_layers:
+            elif edge_id in edge_to_layers:
                 # ה-edge קיים אבל לא בשכבה הזו - זה מוזר, נשאר במקום
                 new_layer_idx = original_layer_idx
                 processed_original += 1
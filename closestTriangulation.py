@@ -7,64 +7,221 @@ import random
 from cgshop2026_pyutils.io import read_instance
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
-from helpFuncs import reconstruct_triangulation_sequence
-from c_builder import fromCompToFlips
+from helpFuncs import reconstruct_triangulation_sequence, normalize_edge, schedule_pairs, reverse_schedule
+from c_builder import fromCompToFlips, remove_redundant_flips
+from edge_universe import EdgeUniverse
+from halfedge import HalfEdgeTriangulation
+from try_distance import region_kernels, RegionCache
+from results_store import ResultsStore
+from lower_bounds import lower_bound
+from window_optimizer import optimize_windows
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# ===========================
+# דחיסה וניקוי של שתי ריצות distance (A -> B ו-B -> A)
+# ===========================
+def _cleaned_schedules(A, B, run_1, run_2, universe: EdgeUniverse, max_num: int = 401) -> list[tuple[int, list]]:
+    """
+    The finished runs among run_1 (distance(A, B)) and run_2 (distance(B, A)), each
+    through fromCompToFlips and remove_redundant_flips, so a schedule and its
+    partner pairs come from the same run. Returns [(d, flips_with_partner_by_layer)]
+    oriented from A to B.
+    """
+    found = []
+    if run_1[0] < max_num:
+        _, s1 = fromCompToFlips(A, run_1[1], universe)
+        d1, _, p1, _ = remove_redundant_flips(A, schedule_pairs(A, s1), universe)
+        found.append((d1, p1))
+    if run_2[0] < max_num:
+        _, s2 = fromCompToFlips(B, run_2[1], universe)
+        d2, _, p2, _ = remove_redundant_flips(B, schedule_pairs(B, s2), universe)
+        found.append((d2, reverse_schedule(p2)[1]))
+    return found
+
+
+# ===========================
+# חיפוש מרחק לאזור אחד (משימה לתהליך עובד)
+# ===========================
+def _region_restart(vertices: list[int], local_xy: list[tuple[int,int]], edges_1: list[tuple[int,int]],
+                    edges_2: list[tuple[int,int]], frozen: list[tuple[int,int]], seed: int, max_num: int = 401,
+                    window_budget: float = 0.0):
+    """
+    One outer restart for one region kernel (see try_distance.region_kernels): retries
+    distance in both directions until a run finishes and keeps the shorter
+    fromCompToFlips schedule (after remove_redundant_flips), oriented from edges_1 to edges_2.
+    window_budget > 0 then spends up to that many seconds on optimize_windows (off by default).
+    Returns (d, flips_by_layer, flips_with_partner_by_layer) in global ids, or None if
+    no run finished. Only the small kernel (coordinates + edge lists) is pickled.
+    """
+    A = HalfEdgeTriangulation.from_points_edges(local_xy, edges_1, frozen)
+    B = HalfEdgeTriangulation.from_points_edges(local_xy, edges_2, frozen)
+    universe = EdgeUniverse.from_triangulations([A, B])
+    rng = random.Random(seed)
+    for p in range(101):
+        run_1 = distance(A, B, universe=universe, seed=rng.getrandbits(64))
+        run_2 = distance(B, A, universe=universe, seed=rng.getrandbits(64))
+        found = _cleaned_schedules(A, B, run_1, run_2, universe, max_num)
+        if found:
+            d, pairs = min(found, key=lambda x: x[0])
+            if window_budget > 0:
+                d, _, pairs = optimize_windows(A, [{e for e, _ in layer} for layer in pairs],
+                                               time_budget=window_budget)
+
+            def glob(e):
+                return normalize_edge(vertices[e[0]], vertices[e[1]])
+
+            pairs = [{(glob(e), glob(f)) for e, f in layer} for layer in pairs]
+            return d, [{e for e, _ in layer} for layer in pairs], pairs
+    return None
+
+
+def _kernel_bound(kernel) -> int:
+    """lower_bounds.lower_bound of one region kernel (vertices, local_xy, edges_1, edges_2, frozen)."""
+    _, local_xy, edges_1, edges_2, frozen = kernel
+    A = HalfEdgeTriangulation.from_points_edges(local_xy, edges_1, frozen)
+    B = HalfEdgeTriangulation.from_points_edges(local_xy, edges_2, frozen)
+    return lower_bound(A, B)
+
+
 # ===========================
 # פונקציה לחישוב כל המרחקים
 # ===========================
-def caculate_all_dis(triangulations: list[FlippableTriangulation]) -> list[list[tuple[int,set,set]]]:
+def caculate_all_dis(triangulations: list[FlippableTriangulation], workers: int = None,
+                     restarts: int = 10, seed: int = None,
+                     cache: RegionCache = None, store: ResultsStore = None,
+                     recompute: bool = True, gaps: dict = None,
+                     universe: EdgeUniverse = None,
+                     window_budget: float = 0.0) -> list[list[tuple[int,set,set]]]:
+    """
+    Best-of-restarts distance for every pair.
+    Every pair is cut at its common edges (try_distance.region_kernels); identical
+    regions - also between different pairs and in the other direction - are looked up
+    in the RegionCache and solved only once. The (region, restart) tasks go to a
+    ProcessPoolExecutor, each with its own seed; workers=None uses every core and
+    workers=1 runs everything in this process. A pair's schedule is its regions'
+    schedules merged by layer index.
+    store: ResultsStore used as a warm start - its result is kept unless this run
+    finds a shorter one, which is then written back. recompute=False skips pairs
+    already in the store.
+    Every region also gets an admissible lower bound (lower_bounds.lower_bound); its
+    later restarts are dropped once one of them reaches it. Restarts are reduced in
+    their index order, so for one seed the pool gives the same result as workers=1
+    (except with window_budget, which depends on timing). The pair's gap
+    (found - bound) is printed and, if gaps is given, stored as gaps[(i, j)] = (lb, ub).
+    universe: EdgeUniverse of the instance (built from triangulations if omitted).
+    window_budget: seconds of optimize_windows per region restart (0 = off).
+    """
     n = len(triangulations)
     dist: list[list[tuple[int,set,set]]] = [[(0,set(),set()) for _ in range(n)] for _ in range(n)]  # <-- שונה
     max_num = 401
+    cache = cache if cache is not None else RegionCache()
+    if universe is None:
+        universe = EdgeUniverse.from_triangulations(triangulations)  # edge ids shared by all pairs
+    bits = [universe.bits(t.get_edges()) for t in triangulations]
+    rng = random.Random(seed)
+
+    edge_lists = [t.get_edges() for t in triangulations]
+    known = {}
+    pair_kernels = {}
+    todo = {}
     for i in range(n):
-        for j in range(i + 1, n): 
-            
-            min_distance_result = (0, set(), set())
-            print(f"now calculate for t{i} and t{j}")
-            min_d = max_num
-            
-            for k in range(10):
-                nd = max_num
-                d = 200
-                p =0
-                while nd == max_num:
-                    nd1,stageflips,l1 = distance(triangulations[i], triangulations[j])
-                    nd2,stageflips2,l2 = distance(triangulations[j], triangulations[i])
-                    if(nd1<nd2): 
-                        nd = nd1
-                    else: 
-                        nd = nd2
-                    if nd < max_num:
-                        d1 , s1 = fromCompToFlips(triangulations[i],stageflips)
-                        d2 , s2 = fromCompToFlips(triangulations[j],stageflips2)
-                        if(d1 < d2):
-                            d,s,l = d1,s1,l1
-                        else:
-                            d,s,l = d2,s2,l2
-                        distance_result = d,s,l
-                        if min_d > d :
-                            min_d = d
-                            min_distance_result = distance_result
-                        print(f"  found length : {d}")
-                    p+=1
-                    if p > 30 and min_d < 23:
-                        print("  * took to long skip")
-                        break
-                    if p > 100:
-                        distance_result = d,s,l
-                        min_distance_result = distance_result
-                        print("  * couldent find distance")
-                        break
-                    
-
-            print(f"  {k+1}.found min : {min_d}")
-            dist[i][j] = min_distance_result  
-            dist[j][i] = min_distance_result  
-
-        dist[i][i] = (0, set(), set()) 
-
+        for j in range(i + 1, n):
+            differ = (bits[i] ^ bits[j]).bit_count() // 2
+            print(f"now calculate for t{i} and t{j} ({differ} edges differ)")
+            if differ == 0:
+                continue
+            if store is not None:
+                known[(i, j)] = store.get(edge_lists[i], edge_lists[j])
+                if known[(i, j)] is not None:
+                    print(f"  stored result : {known[(i, j)][0]}")
+                    dist[i][j] = dist[j][i] = known[(i, j)]
+                    if not recompute:
+                        continue
+            kernels = list(region_kernels(triangulations[i], triangulations[j]))
+            pair_kernels[(i, j)] = kernels
+            for kernel in kernels:
+                key = RegionCache.key(kernel)
+                if key in todo or RegionCache._reversed(key) in todo:
+                    cache.hits += 1  # כבר בתור - נפתר פעם אחת
+                elif cache.get(kernel) is None:
+                    todo[key] = kernel
+
+    bounds = {key: _kernel_bound(kernel) for key, kernel in todo.items()}
+    tasks = {key: [(*kernel, rng.getrandbits(64), max_num, window_budget) for _ in range(restarts)]
+             for key, kernel in todo.items()}
+    # results[key][k] = תוצאת ההרצה ה-k של האזור; הצמצום תמיד לפי סדר k,
+    # כך שבמאגר תהליכים יוצא בדיוק מה שיוצא בריצה סדרתית עם אותו seed
+    results = {key: {} for key in tasks}
+    first_hit = {}  # key -> ההרצה הראשונה (לפי k) שהגיעה לחסם התחתון
+    if workers == 1:
+        for key, region_tasks in tasks.items():
+            for k, args in enumerate(region_tasks):
+                r = _region_restart(*args)
+                results[key][k] = r
+                if r is not None and r[0] <= bounds[key]:
+                    first_hit[key] = k
+                    break  # הגענו לחסם התחתון - אין טעם להמשיך
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for key, region_tasks in tasks.items():
+                for k, args in enumerate(region_tasks):
+                    futures[pool.submit(_region_restart, *args)] = (key, k)
+            for f in as_completed(futures):
+                if f.cancelled():
+                    continue
+                key, k = futures[f]
+                r = f.result()
+                results[key][k] = r
+                if r is not None and r[0] <= bounds[key] and k < first_hit.get(key, restarts):
+                    first_hit[key] = k
+                    # רק הרצות מאוחרות יותר מתבטלות - גם הסדרתית לא הייתה מגיעה אליהן
+                    for g, (other, j) in futures.items():
+                        if other == key and j > k:
+                            g.cancel()
+    for key, by_restart in results.items():
+        last = first_hit.get(key, len(tasks[key]) - 1)
+        found = [by_restart[k] for k in range(last + 1) if by_restart.get(k) is not None]
+        if found:
+            cache.put(todo[key], min(found, key=lambda r: r[0]))
+
+    for (i, j), kernels in pair_kernels.items():
+        flips_by_layer = []
+        flips_with_partner_by_layer = []
+        for kernel in kernels:
+            result = cache.find(kernel)
+            if result is None:
+                break
+            for k, layer_pairs in enumerate(result[2]):
+                if k == len(flips_by_layer):
+                    flips_by_layer.append(set())
+                    flips_with_partner_by_layer.append(set())
+                flips_by_layer[k] |= {e for e, _ in layer_pairs}
+                flips_with_partner_by_layer[k] |= layer_pairs
+        else:
+            min_distance_result = (len(flips_by_layer), flips_by_layer, flips_with_partner_by_layer)
+            lb = lower_bound(triangulations[i], triangulations[j])
+            ub = min(min_distance_result[0], known[(i, j)][0]) if known.get((i, j)) is not None else min_distance_result[0]
+            print(f"  t{i}-t{j} found min : {min_distance_result[0]} (lower bound {lb}, gap {ub - lb})")
+            if gaps is not None:
+                gaps[(i, j)] = (lb, ub)
+            if known.get((i, j)) is not None and known[(i, j)][0] <= min_distance_result[0]:
+                continue  # התוצאה מהמאגר טובה יותר
+            dist[i][j] = dist[j][i] = min_distance_result
+            if store is not None and store.put(edge_lists[i], edge_lists[j], len(flips_by_layer), flips_with_partner_by_layer):
+                print("  stored improved result")
+            continue
+        print(f"  * t{i}-t{j} couldent find distance")
+        if known.get((i, j)) is None:
+            dist[i][j] = dist[j][i] = (max_num, set(), set())
+
+    print(f"  {cache.report()}")
     return dist
 
+def common_edges(triangulations: list[FlippableTriangulation], universe: EdgeUniverse = None) -> list[tuple[int,int]]:
+    """Edges present in every triangulation (one word-parallel AND over their bitsets)."""
+    U = universe if universe is not None else EdgeUniverse()
+    return U.edges_of_bits(U.common_bits([U.bits(t.get_edges()) for t in triangulations]))
+
 # ===========================
 # פונקציה למציאת אינדקס המינימום
 # ===========================
@@ -78,16 +235,20 @@ def caculate_min_dis(arr: list[int], n: int) -> int:
 # ===========================
 # פונקציה למציאת ה-triangulation הקרוב ביותר
 # ===========================
-def closestTringulation(triangulations: list[FlippableTriangulation], imposter: bool = False) -> tuple[int, FlippableTriangulation, list[list[tuple[int,set,set]]]]:
+def closestTringulation(triangulations: list[FlippableTriangulation], imposter: bool = False,
+                        store: ResultsStore = None) -> tuple[int, FlippableTriangulation, list[list[tuple[int,set,set]]]]:
     """
     מוצא את הטריאנגולציה הקרובה ביותר לכל השאר
     
     Args:
         triangulations: רשימת טריאנגולציות
         imposter: אם True, האיבר האחרון ברשימה הוא imposter ולא נכלל בחישוב הסכום
+        store: ResultsStore של המופע (התחלה חמה מריצות קודמות)
     """
     n = len(triangulations)
-    distance_result_matrix = caculate_all_dis(triangulations)
+    universe = EdgeUniverse.from_triangulations(triangulations)  # אותם מזהים לחיתוך ולכל הזוגות
+    print(f"{len(common_edges(triangulations, universe))} edges are common to all triangulations")
+    distance_result_matrix = caculate_all_dis(triangulations, store=store, universe=universe)
 
     arr = [0] * n
     
@@ -114,42 +275,56 @@ def closestTringulation(triangulations: list[FlippableTriangulation], imposter:
 
 def closest_to_target(triangulations: list[FlippableTriangulation],
                       target: FlippableTriangulation,
-                      repeats: int = 5):
+                      repeats: int = 5,
+                      store: ResultsStore = None,
+                      gaps: dict = None):
     """
     מחזירה את הטריאנגולציה הכי קרובה ל-target
+    store: ResultsStore - a stored schedule is the starting best, improvements are written back
+    gaps: if given, gaps[i] = (lower bound, found) for every T_i; the repeats stop at the bound
+    Every run goes through fromCompToFlips and remove_redundant_flips; the schedules
+    in the result are oriented from T_i to target.
     """
 
     best_dist = float("inf")
     best_index = -1
     best_triang = None
     distance_results = []
+    universe = EdgeUniverse.from_triangulations(list(triangulations) + [target])
+    max_num = 401
 
     for i, T in enumerate(triangulations):
         print(f" {i+1}.Checking distance between target and T{i}")
 
         min_d = float("inf")
         best_result = None
+        if store is not None:
+            best_result = store.get(T.get_edges(), target.get_edges())
+            if best_result is not None:
+                min_d = best_result[0]
+                print(f"   stored result : {min_d}")
+        stored_d = min_d
+        lb = lower_bound(T, target)
 
         for k in range(repeats):
-            nd1,stageflips,l1 = distance(T, target)
-            nd2,stageflips2,l2 = distance(target,T)
-            if(nd1<nd2): 
-                nd = nd1
-            else: 
-                nd = nd2
-            
-            d1 , s1 = fromCompToFlips(T,stageflips)
-            d2 , s2 = fromCompToFlips(target,stageflips2)
-            if(d1 < d2):
-                d,s,l = d1,s1,l1
-            else:
-                d,s,l = d2,s2,l2
-            distance_result = d,s,l
+            if min_d <= lb:
+                break  # אופטימלי - החסם התחתון הושג
+            run_1 = distance(T, target, universe=universe)
+            run_2 = distance(target, T, universe=universe)
+            found = _cleaned_schedules(T, target, run_1, run_2, universe, max_num)
+            if not found:
+                print(f"   {k+1}.couldent find distance")
+                continue
+            d, pairs = min(found, key=lambda x: x[0])
             print(f"   {k+1}.found length : {d}")
             if min_d > d :
                 min_d = d
-                best_result = distance_result
-        print(f"   found min : {min_d}")
+                best_result = d, [{e for e, _ in layer} for layer in pairs], pairs
+        print(f"   found min : {min_d} (lower bound {lb}, gap {min_d - lb})")
+        if gaps is not None:
+            gaps[i] = (lb, min_d)
+        if store is not None and best_result is not None and min_d < stored_d:
+            store.put(T.get_edges(), target.get_edges(), min_d, best_result[2])
         
         distance_results.append(best_result)
 
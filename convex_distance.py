@@ -0,0 +1,228 @@
+import numpy as np
+
+from helpFuncs import normalize_edge
+from halfedge import orient
+from exact_distance import ExactDistanceSolver
+
+
+# =========================================================
+# מצולע קמור: ייצוג קומבינטורי בלבד + חיפוש IDA* הכללי
+# =========================================================
+
+def convex_cycle(xy, vertices) -> list[int] | None:
+    """
+    The vertices in ccw order if they are in strictly convex position
+    (no three collinear on the hull, none inside), otherwise None.
+    """
+    order = sorted(vertices, key=lambda i: (xy[i][0], xy[i][1]))
+    if len(order) < 3:
+        return None
+
+    def half(seq):
+        chain = []
+        for p in seq:
+            while len(chain) >= 2 and orient(xy, chain[-2], chain[-1], p) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain
+
+    cycle = half(order)[:-1] + half(list(reversed(order)))[:-1]
+    return cycle if len(cycle) == len(order) else None
+
+
+def cycle_crossing_counts(pos: dict, edges, targets) -> np.ndarray:
+    """
+    segment_index.crossing_counts for diagonals of a convex polygon, without
+    coordinates: two diagonals cross exactly when their endpoints interleave on the
+    cycle (pos: vertex -> its index on the cycle). Shared endpoints never cross.
+    """
+    def positions(es):
+        P = np.array([sorted((pos[u], pos[v])) for u, v in es], dtype=np.int64).reshape(-1, 2)
+        return P[:, 0], P[:, 1]
+
+    edges, targets = list(edges), list(targets)
+    if not edges or not targets:
+        return np.zeros(len(targets), dtype=np.int64)
+    a1, a2 = positions(targets)
+    b1, b2 = positions(edges)
+    a1, a2 = a1[:, None], a2[:, None]
+    cross = ((a1 < b1) & (b1 < a2) & (a2 < b2)) | ((b1 < a1) & (a1 < b2) & (b2 < a2))
+    return cross.sum(axis=1)
+
+
+class ConvexTriangulation:
+    """
+    Triangulation of a convex polygon kept purely combinatorially: every diagonal
+    maps to its two apexes (the third vertices of its triangles). In convex position
+    every diagonal can be flipped, so a flip only swaps the diagonal with its apexes
+    and renames the apex of the four sides; there are no orientation tests at all.
+    Same interface as FlippableTriangulation, so ExactDistanceSolver runs on it.
+    speculate() gives an undo-log overlay like HalfEdgeTriangulation's (a flip is
+    undone by flipping the edge it created), and crossing_counts() feeds the
+    crossing bound of lower_bounds from the cycle order alone.
+    """
+
+    def __init__(self, apex: dict, sides: frozenset, pos: dict):
+        self._apex = apex
+        self._sides = sides
+        self._pos = pos
+        self._queue = []
+        self._busy = set()
+        self._undo = []
+
+    @classmethod
+    def from_cycle(cls, cycle: list[int], diagonals) -> 'ConvexTriangulation':
+        """cycle: polygon vertices in ccw order; diagonals: the interior edges."""
+        m = len(cycle)
+        sides = frozenset(normalize_edge(cycle[i], cycle[(i + 1) % m]) for i in range(m))
+        nbrs = {v: set() for v in cycle}
+        for u, v in list(sides) + [normalize_edge(*e) for e in diagonals]:
+            nbrs[u].add(v)
+            nbrs[v].add(u)
+        apex = {}
+        for u, v in (normalize_edge(*e) for e in diagonals):
+            apex[(u, v)] = sorted(nbrs[u] & nbrs[v])
+            if len(apex[(u, v)]) != 2:
+                raise ValueError(f"{(u, v)} is not a diagonal of a triangulation of the polygon")
+        return cls(apex, sides, {v: i for i, v in enumerate(cycle)})
+
+    def fork(self) -> 'ConvexTriangulation':
+        return ConvexTriangulation({e: list(p) for e, p in self._apex.items()}, self._sides, self._pos)
+
+    def get_edges(self) -> list[tuple[int, int]]:
+        return list(self._apex)
+
+    def get_flip_partner(self, edge) -> tuple[int, int]:
+        e = normalize_edge(*edge)
+        if e not in self._apex:
+            raise ValueError(f"Edge {e} is not a diagonal of the triangulation")
+        return normalize_edge(*self._apex[e])
+
+    def _triangles(self, e):
+        (u, w), (v, z) = e, self._apex[e]
+        return frozenset((u, w, v)), frozenset((u, w, z))
+
+    def possible_flips(self) -> list[tuple[int, int]]:
+        return self._possible(self._busy)
+
+    def _possible(self, busy) -> list[tuple[int, int]]:
+        return [e for e in self._apex if not (set(self._triangles(e)) & busy)]
+
+    def crossing_counts(self, edges, targets) -> np.ndarray:
+        return cycle_crossing_counts(self._pos, edges, targets)
+
+    def add_flip(self, edge) -> tuple[int, int]:
+        return self._enqueue(edge, self._queue, self._busy)
+
+    def _enqueue(self, edge, queue, busy) -> tuple[int, int]:
+        e = normalize_edge(*edge)
+        partner = self.get_flip_partner(e)
+        t1, t2 = self._triangles(e)
+        if t1 in busy or t2 in busy:
+            raise ValueError(f"Edge {e} shares a triangle with a pending flip")
+        busy |= {t1, t2}
+        queue.append(e)
+        return partner
+
+    def commit(self):
+        for e in self._queue:
+            self._flip(e)
+        self._queue.clear()
+        self._busy.clear()
+
+    def speculate(self) -> 'ConvexSpeculation':
+        return ConvexSpeculation(self)
+
+    def _flip(self, e, log=None) -> tuple[int, int]:
+        u, w = e
+        v, z = self._apex.pop(e)
+        f = normalize_edge(v, z)
+        self._apex[f] = [u, w]
+        # כל צלע של המרובע מחליפה את הקודקוד שמולה
+        for side, old, new in (((u, v), w, z), ((w, v), u, z), ((u, z), w, v), ((w, z), u, v)):
+            side = normalize_edge(*side)
+            p = self._apex.get(side)
+            if p is not None:
+                p[p.index(old)] = new
+        if log is not None:
+            log.append(f)
+        return f
+
+    def _rollback(self, mark: int):
+        # היפוך הפוך של הקשת שנוצרה מחזיר את המשולשים ואת הקודקודים שמול הצלעות
+        while len(self._undo) > mark:
+            self._flip(self._undo.pop())
+
+    def __eq__(self, other) -> bool:
+        return set(self._apex) == set(other.get_edges())
+
+    __hash__ = None
+
+
+class ConvexSpeculation:
+    """
+    Fork-like overlay on a ConvexTriangulation for trial flips, the counterpart of
+    halfedge.SpeculativeFlips: committed flips change the base in place and go on
+    its undo stack, rollback() flips them back. Overlays nest and roll back LIFO.
+    """
+
+    def __init__(self, base: ConvexTriangulation):
+        self._base = base
+        self._mark = len(base._undo)
+        self._queue = []
+        self._busy = set()
+
+    def get_flip_partner(self, edge) -> tuple[int, int]:
+        return self._base.get_flip_partner(edge)
+
+    def get_edges(self) -> list[tuple[int, int]]:
+        return self._base.get_edges()
+
+    def possible_flips(self) -> list[tuple[int, int]]:
+        return self._base._possible(self._busy)
+
+    def crossing_counts(self, edges, targets) -> np.ndarray:
+        return self._base.crossing_counts(edges, targets)
+
+    def add_flip(self, edge) -> tuple[int, int]:
+        return self._base._enqueue(edge, self._queue, self._busy)
+
+    def commit(self):
+        for e in self._queue:
+            self._base._flip(e, self._base._undo)
+        self._queue.clear()
+        self._busy.clear()
+
+    def fork(self) -> ConvexTriangulation:
+        return self._base.fork()
+
+    def speculate(self) -> 'ConvexSpeculation':
+        return ConvexSpeculation(self._base)
+
+    def rollback(self):
+        self._queue.clear()
+        self._busy.clear()
+        self._base._rollback(self._mark)
+
+    def __eq__(self, other) -> bool:
+        return self._base.__eq__(other._base if isinstance(other, ConvexSpeculation) else other)
+
+    __hash__ = None
+
+
+def convex_ida_distance(cycle: list[int], edges_a, edges_b, max_k: int = 64, max_nodes: int = 200_000,
+                        time_limit: float = None):
+    """
+    Exact distance between two triangulations of the convex polygon `cycle`
+    (edges_a / edges_b are their diagonals), bounded by max_k layers.
+    This is the generic IDA* of ExactDistanceSolver on a ConvexTriangulation: the
+    representation (no orientation tests, undo-log speculation) and the crossing
+    bound (interleaving on the cycle) are convex-specific, the search and its
+    branching are the same as for any other input. The O(3.82^k) branching rules
+    are for sequential flip distance and are not used here.
+    Returns the distance() triple, or None over budget.
+    """
+    a = ConvexTriangulation.from_cycle(cycle, edges_a)
+    b = ConvexTriangulation.from_cycle(cycle, edges_b)
+    return ExactDistanceSolver(a, b, max_nodes=max_nodes, max_depth=max_k, backend="flippable",
+                               time_limit=time_limit).solve()
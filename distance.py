@@ -7,153 +7,411 @@ from collections import defaultdict
 from cgshop2026_pyutils.io import read_instance
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
-from helpFuncs import normalize_edge , new_triangles,diff,isFree,maximal_independent_subsets
-edge_attempt_count = defaultdict(int)
-def distance(a: FlippableTriangulation,
-             b: FlippableTriangulation):
-    edge_attempt_count.clear()
+from helpFuncs import normalize_edge , new_triangles,diff,isFree,maximal_independent_subsets,speculation,ChangedEdgeTracker,quad_edges,flip_set
+from halfedge import as_backend, coords_of
+from edge_universe import EdgeUniverse
+from fpt_distance import fpt_distance
+from convex_distance import convex_cycle, convex_ida_distance
+from segment_index import SegmentIndex
+from insertion_distance import insertion_distance
 
-    k = 16
-    dist =0
-    troubles_in_paradise = 0
-    flips_by_layer = list()
-    flips_with_partner_by_layer = list()
-    lista = [normalize_edge(*e) for e in a.get_edges()]
-    listb = [normalize_edge(*e) for e in b.get_edges()]
-    lastFlips = set()
-
-    set_b = set(listb)
-    a_working = a.fork()
-    setChangedEdges = set(normalize_edge(*e) for e in diff(lista, listb))
-    while not a_working.__eq__(b):
-        giga = 0
-        setFlips = set()
-        setFlipsWithPartner = set()
-        toRemove = set()
-        toAdd = set()
-        amount = 0
-        for e in set(setChangedEdges):
+
+class BlockingScoreCache:
+    """
+    blocking_edges() scores keyed by edge id, together with the footprint (edge ids
+    whose quads the search read). A committed flip only changes the quads of its own
+    quad_edges(), so only entries whose footprint contains one of them are dropped.
+    The pending flips of the current layer are not part of the key; Huristic
+    re-checks every flip against them before queueing it.
+    """
+
+    def __init__(self, universe: EdgeUniverse):
+        self.universe = universe
+        self.scores = {}
+        self.footprints = {}
+        self.by_edge = defaultdict(set)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, e):
+        score = self.scores.get(e)
+        if score is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return score
+
+    def put(self, e, score: int, footprint: set):
+        self.scores[e] = score
+        self.footprints[e] = footprint
+        for x in footprint:
+            self.by_edge[x].add(e)
+
+    def invalidate(self, flips_with_partner):
+        U = self.universe
+        for e, flip_rev in flips_with_partner:
+            for x in quad_edges(U.edge(e), U.edge(flip_rev)):
+                for key in self.by_edge.pop(U.intern(*x), ()):
+                    self._drop(key)
+
+    def _drop(self, key):
+        self.scores.pop(key, None)
+        for x in self.footprints.pop(key, ()):
+            keys = self.by_edge.get(x)
+            if keys is not None:
+                keys.discard(key)
+
+
+class CrossingPotential:
+    """
+    Deterministic alternative to Huristic: the potential of a triangulation is the
+    number of (edge, target edge) crossings, and the gain of flipping e into f is
+    cross(e) - cross(f). cross() of an edge only depends on the target, so it is
+    counted once per edge (SegmentIndex over the target edges); gains are cached per
+    edge id and dropped only for the quad_edges() of committed flips.
+    A wrong edge always crosses the target and some flip always lowers the potential
+    (Hanke, Ottmann, Schuierer), so every layer makes progress.
+    """
+
+    def __init__(self, xy, edges_b, universe: EdgeUniverse):
+        self.universe = universe
+        self.index = SegmentIndex(xy, edges_b)
+        self.target = set(self.index.segments)
+        self.cross = {}
+        self.gains = {}
+
+    def crossings(self, e: int) -> int:
+        c = self.cross.get(e)
+        if c is None:
+            c = self.cross[e] = self.index.count(*self.universe.edge(e), self.target)
+        return c
+
+    def gain(self, a, e: int) -> int | None:
+        """Crossings removed by flipping e now, None if e cannot be flipped."""
+        if e not in self.gains:
             try:
-                if isFree(a_working, set_b, e):
-                    flip_rev = normalize_edge(*a_working.get_flip_partner(e))
-                    a_working.add_flip(e)
-                    toRemove.add(e)
-                    setFlips.add(e)
-                    setFlipsWithPartner.add((e,flip_rev))
-                    edge_attempt_count[flip_rev] = 1 + edge_attempt_count[e]
-                    amount+=1
+                self.gains[e] = self.crossings(e) - self.crossings(self.universe.partner_id(a, e))
+            except ValueError:
+                self.gains[e] = None
+        return self.gains[e]
+
+    def layer(self, a, changed_edges) -> set[tuple[int, int]]:
+        """
+        Queues a maximal set of non-conflicting improving flips on a, best gain first
+        (ties by edge id). Returns the (edge, partner) id pairs.
+        """
+        U = self.universe
+        scored = [(self.gain(a, e), e) for e in changed_edges]
+        scored = sorted((-g, e) for g, e in scored if g is not None and g > 0)
+        flips = flip_set(a)
+        chosen = set()
+        for _, e in scored:
+            if U.edge(e) not in flips:
+                continue
+            try:
+                flip_rev = U.partner_id(a, e)
+                a.add_flip(U.edge(e))
             except ValueError:
                 continue
-        
-        setFlips_h, toRemove_h, toAdd_h ,flips_h = Huristic(a_working, set_b, setChangedEdges, lastFlips, k)
-        toRemove |= toRemove_h
-        toAdd |= toAdd_h
-        setFlips |= setFlips_h
-        setFlipsWithPartner |= flips_h
-        
-        #setChangedEdges -= toRemove
-        
-        #setChangedEdges |= toAdd
-        lastFlips = setFlips.copy()
-
-        a_working.commit() # we commite the flips in the end
-        flips_by_layer.append(setFlips)
-        flips_with_partner_by_layer.append(setFlipsWithPartner)
-        dist+=1
-        setChangedEdges = {
-            normalize_edge(*e)
-            for e in a_working.get_edges()
-            if normalize_edge(*e) not in set_b
-        }
-
-     #   print("still diff:", len(set(a_working.get_edges()) - set_b))
-      
-      #  print("changedEdges:", len(setChangedEdges))
-        if(dist > 400):
-            #print(f"250 itertion it too much itteratio we are goin to stop")
-            break
-
-    #if(dist <= 400):
-        #print(f"  end distance is {dist}")
-
-    return dist , flips_by_layer , flips_with_partner_by_layer
+            chosen.add((e, flip_rev))
+        return chosen
+
+    def invalidate(self, flips_with_partner):
+        U = self.universe
+        for e, flip_rev in flips_with_partner:
+            for x in quad_edges(U.edge(e), U.edge(flip_rev)):
+                self.gains.pop(U.intern(*x), None)
+
+
+def is_free(a, set_b: set[int], e: int, U: EdgeUniverse) -> bool:
+    """isFree() on edge ids: flipping e creates an edge of the target."""
+    try:
+        return U.partner_id(a, e) in set_b
+    except ValueError:
+        return False
+
+
+def scored_edges(a, set_b, edges, k, U: EdgeUniverse, cache=None) -> list[tuple[int, int]]:
+    """(edge id, blocking_edges score) for every edge id, served from cache where still valid."""
+    edge_by_score = []
+    edges = list(edges)
+    # קשתות שאי אפשר להפוך מקבלות 0 בלי להריץ את blocking_edges
+    flippable = U.flippable_mask(a, edges) if edges else []
+    for e, ok in zip(edges, flippable):
+        if not ok:
+            edge_by_score.append((e, 0))
+            continue
+        try:
+            score = cache.get(e) if cache is not None else None
+            if score is None:
+                footprint = set() if cache is not None else None
+                score = blocking_edges(a, set_b, {e}, k, U, footprint)
+                if cache is not None:
+                    cache.put(e, score, footprint)
+            edge_by_score.append((e, score))
+        except ValueError:
+            continue
+    return edge_by_score
+
+
+class DistanceSolver:
+    """
+    One distance computation from a to b with all of its per-run state
+    (attempt counts, last layer's flips, RNG, counters), so several solvers can run
+    at the same time in threads or asyncio tasks without sharing anything.
+    Runs that get the same seed and their own universe give the same result whether
+    they run serially or concurrently. A shared universe is safe too, but the order in
+    which concurrent runs intern new edges then decides the ids, and with them the
+    iteration order of the searches.
+
+    backend: "flippable" works on the given triangulations, "halfedge" runs the
+    whole search (Huristic / blocking_edges included) on a HalfEdgeTriangulation copy of a.
+    cache_scores: reuse blocking_edges scores between layers (see BlockingScoreCache).
+    heuristic: "blocking" (free flips + Huristic) or "crossing" (CrossingPotential).
+    universe: edge ids shared by all calls on one instance (a fresh one if omitted).
+    seed: seed of this run's RNG; if omitted it is drawn from the global random module,
+    so random.seed() still makes a serial sequence of runs reproducible.
+    Internally all edge sets hold ids; the returned layers hold (u, v) tuples.
+    """
+
+    k = 16
+    max_layers = 400
+
+    def __init__(self, a: FlippableTriangulation,
+                 b: FlippableTriangulation,
+                 backend: str = "flippable",
+                 cache_scores: bool = True,
+                 universe: EdgeUniverse = None,
+                 seed: int = None,
+                 heuristic: str = "blocking"):
+        if heuristic not in ("blocking", "crossing"):
+            raise ValueError(f"Unknown heuristic {heuristic!r}")
+        self.a = a
+        self.b = b
+        self.backend = backend
+        self.heuristic = heuristic
+        self.U = universe if universe is not None else EdgeUniverse()
+        self.score_cache = BlockingScoreCache(self.U) if cache_scores else None
+        self.rng = random.Random(seed if seed is not None else random.getrandbits(64))
+        self.attempts = defaultdict(int)
+        self.lastFlips = set()
+        # מונים
+        self.layers = 0
+        self.free_flips = 0
+        self.heuristic_flips = 0
+
+    def solve(self):
+        U = self.U
+        dist =0
+        flips_by_layer = list()
+        flips_with_partner_by_layer = list()
+        lista = [U.intern(*e) for e in self.a.get_edges()]
+        listb = [U.intern(*e) for e in self.b.get_edges()]
+
+        set_b = set(listb)
+        a_working = as_backend(self.a, self.backend).fork()
+        changed = ChangedEdgeTracker(lista, set_b)
+        setChangedEdges = changed.edges
+        potential = None
+        if self.heuristic == "crossing":
+            potential = CrossingPotential(coords_of(self.a), self.b.get_edges(), U)
+        while changed.mismatch:
+            setFlips = set()
+            setFlipsWithPartner = set()
+            toRemove = set()
+            toAdd = set()
+            amount = 0
+            if potential is not None:
+                setFlipsWithPartner = potential.layer(a_working, setChangedEdges)
+                setFlips = {e for e, _ in setFlipsWithPartner}
+                self.heuristic_flips += len(setFlips)
+            if not setFlips:
+                # free flips + Huristic (also the fallback if the potential gets stuck)
+                for e in set(setChangedEdges):
+                    try:
+                        if is_free(a_working, set_b, e, U):
+                            flip_rev = U.partner_id(a_working, e)
+                            a_working.add_flip(U.edge(e))
+                            toRemove.add(e)
+                            setFlips.add(e)
+                            setFlipsWithPartner.add((e,flip_rev))
+                            self.attempts[flip_rev] = 1 + self.attempts[e]
+                            amount+=1
+                    except ValueError:
+                        continue
+                self.free_flips += amount
+
+                setFlips_h, toRemove_h, toAdd_h ,flips_h = Huristic(a_working, set_b, setChangedEdges, self.lastFlips, self.k, U,
+                                                                    self.score_cache, self.attempts, self.rng)
+                self.heuristic_flips += len(setFlips_h)
+                toRemove |= toRemove_h
+                toAdd |= toAdd_h
+                setFlips |= setFlips_h
+                setFlipsWithPartner |= flips_h
+
+            self.lastFlips = setFlips.copy()
+
+            a_working.commit() # we commite the flips in the end
+            flips_by_layer.append(U.edges(setFlips))
+            flips_with_partner_by_layer.append({(U.edge(e), U.edge(f)) for e, f in setFlipsWithPartner})
+            dist+=1
+            changed.commit(setFlipsWithPartner)
+            if self.score_cache is not None:
+                self.score_cache.invalidate(setFlipsWithPartner)
+            if potential is not None:
+                potential.invalidate(setFlipsWithPartner)
+
+         #   print("still diff:", len(set(a_working.get_edges()) - set_b))
+
+          #  print("changedEdges:", len(setChangedEdges))
+            if(dist > self.max_layers):
+                #print(f"250 itertion it too much itteratio we are goin to stop")
+                break
+
+        #if(dist <= 400):
+            #print(f"  end distance is {dist}")
+
+        self.layers = dist
+        return dist , flips_by_layer , flips_with_partner_by_layer
+
+
+def distance(a: FlippableTriangulation,
+             b: FlippableTriangulation,
+             backend: str = "flippable",
+             cache_scores: bool = True,
+             universe: EdgeUniverse = None,
+             seed: int = None,
+             mode: str = "heuristic",
+             max_k: int = 8,
+             heuristic: str = "blocking",
+             time_limit: float = 10.0):
+    """
+    Thin wrapper around DistanceSolver (see there for the parameters).
+    mode="fpt" first tries fpt_distance() (exact per common-edge region, at most
+    max_k layers) and falls back to the heuristic DistanceSolver when that bound is
+    exceeded, its node budget runs out or it takes more than time_limit seconds
+    (None = no limit); the fallback result is not exact.
+    mode="convex" does the same with convex_ida_distance() on the whole polygon
+    (points must be in convex position).
+    heuristic="crossing" replaces the random Huristic by CrossingPotential.
+    mode="insertion" runs the edge-insertion engine (insertion_distance.py) instead:
+    deterministic and always finishes, no layer limit.
+    """
+    if mode not in ("heuristic", "fpt", "insertion", "convex"):
+        raise ValueError(f"Unknown mode {mode!r}")
+    if mode == "insertion":
+        return insertion_distance(a, b, universe)
+    if mode == "fpt":
+        result = fpt_distance(a, b, max_k=max_k, time_limit=time_limit)
+        if result is not None:
+            return result
+    if mode == "convex":
+        xy = coords_of(a)
+        cycle = convex_cycle(xy, range(len(xy)))
+        if cycle is None:
+            raise ValueError("mode='convex' needs points in convex position")
+        sides = {normalize_edge(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))}
+        result = convex_ida_distance(cycle, {normalize_edge(*e) for e in a.get_edges()} - sides,
+                                     {normalize_edge(*e) for e in b.get_edges()} - sides, max_k,
+                                     time_limit=time_limit)
+        if result is not None:
+            return result
+    return DistanceSolver(a, b, backend, cache_scores, universe, seed, heuristic).solve()
+
+
 def Huristic(
     a: FlippableTriangulation,
-    set_b: set[tuple[int, int]],
-    setChangedEdges: set[tuple[int, int]],
-    lastFlips: set[tuple[int, int]],
-    k: int
+    set_b: set[int],
+    setChangedEdges: set[int],
+    lastFlips: set[int],
+    k: int,
+    U: EdgeUniverse,
+    cache: BlockingScoreCache = None,
+    attempts: defaultdict = None,
+    rng: random.Random = None
 ) -> tuple[set, set, set]:  # מחזיר גם toRemove וגם toAdd
-       
-    edge_by_score = []
+    """attempts / rng belong to the calling DistanceSolver (fresh ones if omitted)."""
+    if attempts is None:
+        attempts = defaultdict(int)
+    if rng is None:
+        rng = random.Random()
+
     to_Flip = set()
     toRemove = set()
     toAdd = set()
     setFlipsWithPartner = set()
     
-    for e in set(setChangedEdges):
-        try:
-            score = blocking_edges(a, set_b, {e}, k)
-            edge_by_score.append((e, score))
-        except ValueError:
-            continue
+    edge_by_score = scored_edges(a, set_b, set(setChangedEdges), k, U, cache)
     if not edge_by_score:
       return set(), set(), set(), set()
 
     best_edge, best_score = max(edge_by_score, key=lambda x: x[1])
 
+    flips = flip_set(a)
     for e, score in edge_by_score:
         try:
-            flip_rev = normalize_edge(*a.get_flip_partner(e))
-            if e in a.possible_flips() and flip_rev not in lastFlips:
+            flip_rev = U.partner_id(a, e)
+            if U.edge(e) in flips and flip_rev not in lastFlips:
                 if (score > 0) and e not in set_b:
-                    a.add_flip(e) 
+                    a.add_flip(U.edge(e)) 
                     to_Flip.add(e)
                     toRemove.add(e)
                     toAdd.add(flip_rev)
                     setFlipsWithPartner.add((e,flip_rev))
-                    edge_attempt_count[flip_rev] = 1 + edge_attempt_count[e]
+                    attempts[flip_rev] = 1 + attempts[e]
         except ValueError:
             continue
                          
     if best_score == 0 or len(setChangedEdges)> 100:
         candidates = [e for e in setChangedEdges if e not in set_b and e not in lastFlips]
         for e in candidates:
-            if edge_attempt_count[e] == 0:
+            if attempts[e] == 0:
                 try:
-                    e = random.choice(candidates)
-                    flip_rev = normalize_edge(*a.get_flip_partner(e))
-                    a.add_flip(e)  
+                    e = rng.choice(candidates)
+                    flip_rev = U.partner_id(a, e)
+                    a.add_flip(U.edge(e))  
                     to_Flip.add(e)
                     toRemove.add(e)
                     toAdd.add(flip_rev)
                     setFlipsWithPartner.add((e,flip_rev))
-                    edge_attempt_count[flip_rev] = 1 + edge_attempt_count[e]
+                    attempts[flip_rev] = 1 + attempts[e]
                 except:
                     pass
 
     return to_Flip, toRemove, toAdd ,setFlipsWithPartner
 def blocking_edges(a: FlippableTriangulation, 
-                   set_b: set[tuple[int, int]],
-                   edges: set[tuple[int,int]], 
-                   k: int) -> int:
+                   set_b: set[int],
+                   edges: set[int], 
+                   k: int,
+                   U: EdgeUniverse,
+                   footprint: set = None) -> int:
     """
     מחשב כמה edges חופשיים ניתן להגיע אליהם מ-edges נתון
+    edges / set_b / footprint hold edge ids of U.
+    The trial flips run inside speculation(), so on a HalfEdgeTriangulation no
+    level of the recursion copies the triangulation.
+    footprint: if given, collects every edge whose quad the search looked at.
     """
     if k == 0 or not edges:
         return 0
     
-    a_temp = a.fork()
-    
+    if footprint is not None:
+        footprint.update(edges)
+    with speculation(a) as a_temp:
+        return _blocking_edges_level(a, a_temp, set_b, edges, k, U, footprint)
+
+
+def _blocking_edges_level(a, a_temp, set_b, edges, k, U, footprint) -> int:
     edge_to_partner = {}
     successful_flips = []
     
+    flips = flip_set(a)
     for edge in edges:
         try:
-            partner = a_temp.get_flip_partner(edge)
+            partner = a_temp.get_flip_partner(U.edge(edge))
             edge_to_partner[edge] = partner
-            if edge in a.possible_flips():
-                a_temp.add_flip(edge)
+            if U.edge(edge) in flips:
+                a_temp.add_flip(U.edge(edge))
                 successful_flips.append(edge)
         except ValueError:
             continue
@@ -162,57 +420,59 @@ def blocking_edges(a: FlippableTriangulation,
         return 0
     
     a_temp.commit()
+    temp_flips = flip_set(a_temp)
     
     free_edges = set()
     blocked_edges = set()
-    visited = set(edges) | set_b  
+    visited = set(edges)
     triangles = []
     for edge in successful_flips:
         partner = edge_to_partner[edge]
         t1, t2 = new_triangles(a_temp, partner)
         triangles.append(t1)
         triangles.append(t2)
-        for triangle in [t1, t2]:
-            for e in triangle:
-                e_norm = normalize_edge(*e)
-                
-                if e_norm in visited:
-                    continue
-                
-                visited.add(e_norm)
-                
-                if e_norm not in a_temp.possible_flips():
-                    continue
-                
-                if isFree(a_temp, set_b, e_norm):
-                    free_edges.add(e_norm)
-                else:
-                    blocked_edges.add(e_norm)
+        quad = [U.intern(*e) for e in t1 + t2]
+        if footprint is not None:
+            footprint.update(quad)
+        for e_id in quad:
+            if e_id in visited or e_id in set_b:
+                continue
+            
+            visited.add(e_id)
+            
+            if U.edge(e_id) not in temp_flips:
+                continue
+            
+            if is_free(a_temp, set_b, e_id, U):
+                free_edges.add(e_id)
+            else:
+                blocked_edges.add(e_id)
     
     score = len(free_edges)
     for e in blocked_edges:
-        if e not in free_edges and e  not in set_b and e in a_temp.possible_flips():
+        if e not in free_edges and e  not in set_b and U.edge(e) in temp_flips:
             try:
-                a_dup = a_temp.fork()
-                a_dup.add_flip(e)
-                a_dup.commit()
-                t1, t2 = new_triangles(a,e)
-                for triangle in [t1, t2]:
-                    for e1 in triangle: 
-                       e_norm = normalize_edge(*e1)
-                       if isFree(a_dup, set_b, e_norm):
-                         free_edges.add(e_norm)
+                # the quad around e is read before the trial flip (a_temp is shared with a_dup)
+                t1, t2 = new_triangles(a_temp, U.edge(e))
+                quad = [U.intern(*e1) for e1 in t1 + t2]
+                if footprint is not None:
+                    footprint.update(quad)
+                with speculation(a_temp) as a_dup:
+                    a_dup.add_flip(U.edge(e))
+                    a_dup.commit()
+                    for e_id in quad:
+                        if is_free(a_dup, set_b, e_id, U):
+                            free_edges.add(e_id)
 
             except ValueError:
                 continue
     if not free_edges:       
         for edge in blocked_edges:
-            e_norm = normalize_edge(*edge)
-            if e_norm in a_temp.possible_flips() and e_norm not in set_b:
-                free_edges.add(e_norm)
+            if U.edge(edge) in temp_flips and edge not in set_b:
+                free_edges.add(edge)
 
 
     if free_edges:
-        recursive_score = blocking_edges(a_temp, set_b, free_edges, k - 1)
+        recursive_score = blocking_edges(a_temp, set_b, free_edges, k - 1, U, footprint)
         score += recursive_score 
-    return score
\ No newline at end of file
+    return score
@@ -5,7 +5,6 @@ from cgshop2026_pyutils.geometry import draw_edges, FlippableTriangulation, draw
 from matplotlib.backends.backend_pdf import PdfPages
 from matplotlib import gridspec
 import networkx as nx
-from c_builder import ConnectedDirectedComponent, DynamicGraphManager
 
 def Draw_distance(dist: int,
                   stages_of_flips: list[list[tuple[int, int]]],
@@ -123,7 +122,7 @@ def Draw_distance(dist: int,
 
 def Draw_Manager_Components(manager):
     """
-    Visualizes the connected components stored in the DynamicGraphManager.
+    Visualizes the connected components stored in the FlipDAG (see c_builder.MakeComponents).
     """
     
     # 1. Get all components
@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+
+from helpFuncs import normalize_edge
+
+
+class EdgeUniverse:
+    """
+    Dense int ids for the edges of one instance.
+    Seeded with every edge of the input triangulations and their flip partners;
+    edges met later (deeper in a search) are interned on first use, so ids stay stable.
+    Code inside distance / c_builder / c_builder2 keeps ids in its sets and maps and
+    converts to (u, v) tuples only when calling the triangulation or returning results.
+    intern() is thread-safe, so concurrent DistanceSolver runs may share one universe.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._edges = []
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_triangulations(cls, triangulations) -> 'EdgeUniverse':
+        universe = cls()
+        for t in triangulations:
+            for e in t.get_edges():
+                universe.intern(*e)
+                try:
+                    universe.intern(*t.get_flip_partner(e))
+                except ValueError:
+                    pass
+        return universe
+
+    @classmethod
+    def from_instance(cls, instance) -> 'EdgeUniverse':
+        from halfedge import HalfEdgeTriangulation
+        return cls.from_triangulations(HalfEdgeTriangulation.from_instance(instance))
+
+    def intern(self, u, v) -> int:
+        e = normalize_edge(u, v)
+        i = self._ids.get(e)
+        if i is None:
+            with self._lock:
+                i = self._ids.get(e)
+                if i is None:
+                    i = len(self._edges)
+                    self._edges.append(e)
+                    self._ids[e] = i
+                    self._arrays = None
+        return i
+
+    def get(self, e) -> int | None:
+        """Id of an existing edge, None if it was never interned."""
+        return self._ids.get(normalize_edge(*e))
+
+    def edge(self, i: int) -> tuple[int, int]:
+        return self._edges[i]
+
+    def ids(self, edges) -> set[int]:
+        return {self.intern(*e) for e in edges}
+
+    def edges(self, ids) -> set[tuple[int, int]]:
+        return {self._edges[i] for i in ids}
+
+    def partner_id(self, a, i: int) -> int:
+        """Id of the flip partner of edge i in a (ValueError if it cannot be flipped)."""
+        return self.intern(*a.get_flip_partner(self._edges[i]))
+
+    def flippable_mask(self, a, ids) -> np.ndarray:
+        """
+        Boolean mask over an array of edge ids: can the edge be flipped in a right now.
+        Batched exact-integer test on a HalfEdgeTriangulation, per-edge fallback otherwise.
+        """
+        edges = [self._edges[i] for i in ids]
+        if hasattr(a, "flippable_mask"):
+            return a.flippable_mask(edges)
+        mask = np.zeros(len(edges), dtype=bool)
+        for k, e in enumerate(edges):
+            try:
+                a.get_flip_partner(e)
+                mask[k] = True
+            except ValueError:
+                pass
+        return mask
+
+    # ---------- bitsets (bit i set <=> edge id i present) ----------
+
+    def bits(self, edges) -> int:
+        """Edge set -> Python int bitset, so diff/intersection/equality are word-parallel."""
+        return self.bits_of_ids([self.intern(*e) for e in edges])
+
+    def bits_of_ids(self, ids) -> int:
+        ids = np.fromiter(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+        flags = np.zeros(int(ids.max()) + 1, dtype=np.uint8)
+        flags[ids] = 1
+        return int.from_bytes(np.packbits(flags, bitorder="little").tobytes(), "little")
+
+    def ids_of_bits(self, bits: int) -> np.ndarray:
+        if bits == 0:
+            return np.zeros(0, dtype=np.int32)
+        raw = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(raw, bitorder="little")).astype(np.int32)
+
+    def edges_of_bits(self, bits: int) -> list[tuple[int, int]]:
+        return [self._edges[i] for i in self.ids_of_bits(bits)]
+
+    def words(self, bits: int) -> np.ndarray:
+        """The bitset as a uint64 array sized to the whole universe (for batched NumPy ops)."""
+        n_words = (len(self._edges) + 63) // 64
+        return np.frombuffer(bits.to_bytes(8 * n_words, "little"), dtype="<u8").copy()
+
+    def common_bits(self, bitsets) -> int:
+        """Edges present in every bitset (AND over all of them, word-parallel)."""
+        stacked = np.stack([self.words(x) for x in bitsets])
+        return int.from_bytes(np.bitwise_and.reduce(stacked, axis=0).tobytes(), "little")
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """int32 endpoint arrays (u[i], v[i]) of all interned edges."""
+        if self._arrays is None or len(self._arrays[0]) != len(self._edges):
+            uv = np.array(self._edges, dtype=np.int32).reshape(-1, 2)
+            self._arrays = (uv[:, 0].copy(), uv[:, 1].copy())
+        return self._arrays
+
+    def __len__(self) -> int:
+        return len(self._edges)
+
+    def __contains__(self, e) -> bool:
+        return normalize_edge(*e) in self._ids
@@ -0,0 +1,198 @@
+import time
+
+from cgshop2026_pyutils.geometry import FlippableTriangulation
+
+from helpFuncs import normalize_edge, speculation
+from halfedge import as_backend, coords_of
+from lower_bounds import state_bound
+from edge_universe import EdgeUniverse
+
+
+# =========================================================
+# פותר מדויק למרחק היפוכים מקבילי (מופעים קטנים)
+# =========================================================
+
+class _Budget(Exception):
+    pass
+
+
+class ExactDistanceSolver:
+    """
+    IDA* over parallel flip layers: a move is any non-empty set of flippable edges
+    no two of which share a triangle. States are edge bitsets of an EdgeUniverse and
+    go into a transposition table that remembers the largest remaining depth already
+    searched from them. Meant as a quality oracle and for small subproblems
+    (roughly <= 30 points or distance <= 8); larger inputs run out of max_nodes.
+
+    frozen: edges that may never be flipped (boundary of a subproblem).
+    max_nodes: budget counted per search node and per layer enumerated by _layers
+    (the subsets of a node are exponential in its flippable edges).
+    time_limit: seconds for one solve() besides max_nodes (None = no limit); both
+    are checked inside the enumeration too.
+
+    Two normal forms cut the branching without losing optimal solutions:
+    * a flip is never undone in the very next layer - dropping such a pair from both
+      layers leaves every other flip valid and the final state the same;
+    * after the first layer every flip uses a triangle created by the previous layer -
+      a flip that does not could be moved one layer earlier.
+    Each rewrite removes flips or moves them earlier, so some optimal schedule has both.
+    With one layer left the only possible move (flip every wrong edge) is checked directly.
+    """
+
+    def __init__(self, a: FlippableTriangulation,
+                 b: FlippableTriangulation,
+                 frozen: set = None,
+                 max_nodes: int = 200_000,
+                 max_depth: int = 64,
+                 backend: str = "halfedge",
+                 universe: EdgeUniverse = None,
+                 time_limit: float = None):
+        self.a = as_backend(a, backend).fork()
+        self.xy = coords_of(a) if hasattr(a, "_xy") or hasattr(a, "_flip_map") else None
+        self.U = universe if universe is not None else EdgeUniverse()
+        self.set_b = {normalize_edge(*e) for e in b.get_edges()}
+        self.frozen = {normalize_edge(*e) for e in frozen} if frozen else set()
+        self.target_key = self.U.bits(self.set_b)
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.deadline = None
+        self.nodes = 0
+        self.table = {}
+
+    def lower_bound(self, t) -> int:
+        """
+        lower_bounds.state_bound of t, or None when a frozen wrong edge makes b
+        unreachable.
+        """
+        if (self.frozen - self.set_b) & {normalize_edge(*e) for e in t.get_edges()}:
+            return None
+        return state_bound(t, self.set_b, self.xy)
+
+    def _moves(self, t, last, created):
+        """
+        Flippable edges with their triangles: not frozen, not created by the previous
+        layer, and (except in the first layer) touching a triangle it created.
+        """
+        moves = []
+        for e in t.possible_flips():
+            e = normalize_edge(*e)
+            if e in self.frozen or e in last:
+                continue
+            u, w = e
+            v, z = t.get_flip_partner(e)
+            t1, t2 = frozenset((u, w, v)), frozenset((u, w, z))
+            if created is not None and t1 not in created and t2 not in created:
+                continue
+            moves.append((e, normalize_edge(v, z), t1, t2))
+        # קשתות שההיפוך שלהן יוצר קשת של המטרה קודם
+        moves.sort(key=lambda m: (m[1] not in self.set_b, m[0]))
+        return moves
+
+    def _layers(self, moves, i=0, chosen=(), busy=frozenset()):
+        """Every non-empty independent subset of moves, larger ones first."""
+        if i == len(moves):
+            if chosen:
+                self._tick()
+                yield chosen
+            return
+        m = moves[i]
+        if m[2] not in busy and m[3] not in busy:
+            yield from self._layers(moves, i + 1, chosen + (m,), busy | {m[2], m[3]})
+        yield from self._layers(moves, i + 1, chosen, busy)
+
+    def _last_layer(self, t):
+        """The one layer that reaches b from t, or None if no single layer does."""
+        layer = []
+        busy = set()
+        for e in set(t.get_edges()) - self.set_b:
+            try:
+                v, z = t.get_flip_partner(e)
+            except ValueError:
+                return None
+            u, w = e
+            f = normalize_edge(v, z)
+            t1, t2 = frozenset((u, w, v)), frozenset((u, w, z))
+            if e in self.frozen or f not in self.set_b or t1 in busy or t2 in busy:
+                return None
+            busy |= {t1, t2}
+            layer.append((e, f, t1, t2))
+        return tuple(layer)
+
+    def _tick(self):
+        """One unit of work against max_nodes and the deadline."""
+        self.nodes += 1
+        if self.nodes > self.max_nodes or (self.deadline is not None and time.monotonic() > self.deadline):
+            raise _Budget()
+
+    def _search(self, t, key, g, bound, last, created, path):
+        self._tick()
+        if key == self.target_key:
+            return True
+        h = self.lower_bound(t)
+        if h is None or g + h > bound:
+            return False
+        remaining = bound - g
+        if remaining == 1:
+            layer = self._last_layer(t)
+            if layer is None:
+                return False
+            path.append(layer)
+            return True
+        # the moves depend on the previous layer too, so it is part of the entry
+        entry = (key, frozenset(last))
+        if self.table.get(entry, -1) >= remaining:
+            return False
+        self.table[entry] = remaining
+
+        U = self.U
+        for layer in self._layers(self._moves(t, last, created)):
+            new_key = key
+            for e, f, _, _ in layer:
+                new_key ^= (1 << U.intern(*e)) | (1 << U.intern(*f))
+            with speculation(t) as t_next:
+                for e, _, _, _ in layer:
+                    t_next.add_flip(e)
+                t_next.commit()
+                path.append(layer)
+                new_created = set()
+                for e, f, _, _ in layer:
+                    v, z = f
+                    new_created |= {frozenset((v, z, e[0])), frozenset((v, z, e[1]))}
+                if self._search(t_next, new_key, g + 1, bound, {f for _, f, _, _ in layer}, new_created, path):
+                    return True
+                path.pop()
+        return False
+
+    def solve(self):
+        """(dist, flips_by_layer, flips_with_partner_by_layer) like distance(), or None if over budget."""
+        if self.time_limit is not None:
+            self.deadline = time.monotonic() + self.time_limit
+        key = self.U.bits(self.a.get_edges())
+        bound = self.lower_bound(self.a)
+        if bound is None:
+            return None
+        path = []
+        try:
+            while bound <= self.max_depth:
+                self.table.clear()
+                if self._search(self.a, key, 0, bound, set(), None, path):
+                    return (len(path),
+                            [{e for e, _, _, _ in layer} for layer in path],
+                            [{(e, f) for e, f, _, _ in layer} for layer in path])
+                bound += 1
+        except _Budget:
+            pass
+        return None
+
+
+def exact_distance(a: FlippableTriangulation,
+                   b: FlippableTriangulation,
+                   frozen: set = None,
+                   max_nodes: int = 200_000,
+                   max_depth: int = 64,
+                   backend: str = "halfedge",
+                   universe: EdgeUniverse = None,
+                   time_limit: float = None):
+    """Thin wrapper around ExactDistanceSolver (None when max_nodes or time_limit runs out)."""
+    return ExactDistanceSolver(a, b, frozen, max_nodes, max_depth, backend, universe, time_limit).solve()
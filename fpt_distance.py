@@ -0,0 +1,155 @@
+import time
+from collections import defaultdict
+
+from cgshop2026_pyutils.geometry import FlippableTriangulation
+
+from helpFuncs import normalize_edge
+from halfedge import HalfEdgeTriangulation, as_backend
+from exact_distance import ExactDistanceSolver
+from convex_distance import convex_cycle, convex_ida_distance
+
+
+# =========================================================
+# מצב FPT: פירוק לאזורים לפי קשתות משותפות + חיפוש מדויק חסום ב-k
+# =========================================================
+
+def _regions(t: HalfEdgeTriangulation, cut: set) -> dict:
+    """
+    Groups the triangles of t that are connected across edges outside `cut`.
+    Returns {directed boundary (frozenset of (p, q) with the region on the left): edges inside}.
+    """
+    triangles = t.triangles()
+    parent = list(range(len(triangles)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    by_edge = defaultdict(list)
+    for k, (p0, p1, p2) in enumerate(triangles):
+        for p, q in ((p0, p1), (p1, p2), (p2, p0)):
+            by_edge[normalize_edge(p, q)].append(k)
+    for e, ks in by_edge.items():
+        if len(ks) == 2 and e not in cut:
+            parent[find(ks[0])] = find(ks[1])
+
+    directed = defaultdict(set)
+    for k, (p0, p1, p2) in enumerate(triangles):
+        directed[find(k)] |= {(p0, p1), (p1, p2), (p2, p0)}
+    regions = {}
+    for darts in directed.values():
+        boundary = frozenset((p, q) for p, q in darts if (q, p) not in darts)
+        inside = {normalize_edge(p, q) for p, q in darts if (q, p) in darts}
+        regions[boundary] = inside
+    return regions
+
+
+def common_edge_regions(a: FlippableTriangulation, b: FlippableTriangulation) -> list[tuple[frozenset, set, set]]:
+    """
+    Kernelization of the pair: the common edges are kept and the polygon is cut
+    along them. Each piece is (directed boundary, its edges in a, its edges in b);
+    pieces on which a and b already agree (a single shared triangle) are dropped.
+    The pieces of a and b are matched by their directed boundary.
+    """
+    ha = as_backend(a, "halfedge")
+    hb = as_backend(b, "halfedge")
+    common = set(ha.get_edges()) & set(hb.get_edges())
+    regions_a = _regions(ha, common)
+    regions_b = _regions(hb, common)
+    out = []
+    for boundary, inside_a in regions_a.items():
+        inside_b = regions_b.get(boundary)
+        if inside_b is None:
+            raise ValueError("a and b do not triangulate the same region")
+        if inside_a:
+            out.append((boundary, inside_a, inside_b))
+    return out
+
+
+def convex_region_cycle(xy, boundary: frozenset, inside: set) -> list[int] | None:
+    """
+    The ccw vertex cycle of a region if it is a convex polygon (vertices in strictly
+    convex position and the directed boundary is exactly that cycle), otherwise None.
+    """
+    vertices = {p for p, _ in boundary} | {p for e in inside for p in e}
+    cycle = convex_cycle(xy, vertices)
+    if cycle is None:
+        return None
+    m = len(cycle)
+    if boundary != frozenset((cycle[i], cycle[(i + 1) % m]) for i in range(m)):
+        return None
+    return cycle
+
+
+def region_kernel(xy, boundary: frozenset, inside_1: set, inside_2: set):
+    """
+    One region as a small subproblem: its vertices relabelled 0..m-1, the region
+    edges of each side, and its boundary (frozen, so no flip ever leaves the region).
+    Returns (vertices, local_xy, local_edges_1, local_edges_2, local_frozen).
+    """
+    border = {normalize_edge(p, q) for p, q in boundary}
+    vertices = sorted({p for e in border | inside_1 for p in e})
+    local = {v: k for k, v in enumerate(vertices)}
+
+    def relabel(edges):
+        return [normalize_edge(local[u], local[v]) for u, v in edges]
+
+    return (vertices, [xy[v] for v in vertices],
+            relabel(inside_1 | border), relabel(inside_2 | border), relabel(border))
+
+
+def fpt_distance(a: FlippableTriangulation,
+                 b: FlippableTriangulation,
+                 max_k: int = 8,
+                 max_nodes: int = 200_000,
+                 time_limit: float = None):
+    """
+    Bounded-k exact mode: the common edges are frozen, every region of
+    common_edge_regions() is solved exactly with at most max_k layers, and the
+    region schedules run side by side (layer i = union of the regions' layer i).
+    The result is optimal among schedules that never flip a common edge.
+    Regions that are convex polygons go to convex_ida_distance() (no geometry);
+    the others are searched on their region_kernel(), so a search node costs
+    O(region) and not O(n).
+    Returns the distance() triple, or None if a region needs more than max_k
+    layers or runs out of max_nodes, or the whole call takes more than time_limit seconds.
+    """
+    ha = as_backend(a, "halfedge")
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    flips_by_layer = []
+    flips_with_partner_by_layer = []
+    for boundary, inside_a, inside_b in common_edge_regions(ha, b):
+        left = None if deadline is None else deadline - time.monotonic()
+        if left is not None and left <= 0:
+            return None
+        cycle = convex_region_cycle(ha._xy, boundary, inside_a)
+        if cycle is not None:
+            result = convex_ida_distance(cycle, inside_a, inside_b, max_k, max_nodes, left)
+        else:
+            vertices, local_xy, edges_1, edges_2, frozen = region_kernel(ha._xy, boundary, inside_a, inside_b)
+            k1 = HalfEdgeTriangulation.from_points_edges(local_xy, edges_1, frozen)
+            k2 = HalfEdgeTriangulation.from_points_edges(local_xy, edges_2, frozen)
+            result = ExactDistanceSolver(k1, k2, frozen=frozen, max_nodes=max_nodes, max_depth=max_k,
+                                         time_limit=left).solve()
+            if result is not None:
+                # חזרה מהמספור המקומי של האזור למספור הגלובלי
+                def glob(e):
+                    return normalize_edge(vertices[e[0]], vertices[e[1]])
+
+                d, layers, pairs = result
+                result = (d, [{glob(e) for e in layer} for layer in layers],
+                          [{(glob(e), glob(f)) for e, f in layer} for layer in pairs])
+        if result is None:
+            return None
+        _, layers, pairs = result
+        for i, (layer, layer_pairs) in enumerate(zip(layers, pairs)):
+            if i == len(flips_by_layer):
+                flips_by_layer.append(set())
+                flips_with_partner_by_layer.append(set())
+            flips_by_layer[i] |= layer
+            flips_with_partner_by_layer[i] |= layer_pairs
+
+    return len(flips_by_layer), flips_by_layer, flips_with_partner_by_layer
@@ -0,0 +1,545 @@
+import numpy as np
+from functools import cmp_to_key
+from collections import defaultdict
+
+from helpFuncs import normalize_edge
+
+
+# =========================================================
+# פונקציות גאומטריות (אריתמטיקה שלמה מדויקת)
+# =========================================================
+
+def orient(xy, p, q, r) -> int:
+    """Sign of the turn p->q->r (+1 left, -1 right, 0 collinear)."""
+    px, py = xy[p]
+    qx, qy = xy[q]
+    rx, ry = xy[r]
+    d = (qx - px) * (ry - py) - (qy - py) * (rx - px)
+    return (d > 0) - (d < 0)
+
+
+# מעל 2^30 המכפלות בבדיקת האוריינטציה כבר לא נכנסות ב-int64
+INT64_COORD_LIMIT = 2 ** 30
+
+
+def coord_array(xy) -> np.ndarray:
+    """(n, 2) coordinate array for the batch tests: int64, or Python ints (object) if too large."""
+    arr = np.asarray(xy, dtype=object).reshape(-1, 2)
+    if len(arr) and max(abs(int(c)) for c in arr.ravel()) >= INT64_COORD_LIMIT:
+        return arr
+    return arr.astype(np.int64)
+
+
+def orient_batch(coords, p, q, r) -> np.ndarray:
+    """orient() over index arrays, exact (int64 or object arithmetic, depending on coords)."""
+    P, Q, R = coords[p], coords[q], coords[r]
+    d = (Q[:, 0] - P[:, 0]) * (R[:, 1] - P[:, 1]) - (Q[:, 1] - P[:, 1]) * (R[:, 0] - P[:, 0])
+    return np.sign(d).astype(np.int8)
+
+
+def convex_hull_edges(xy) -> list[tuple[int, int]]:
+    """Monotone chain hull; collinear boundary points are kept as hull vertices."""
+    order = sorted(range(len(xy)), key=lambda i: (xy[i][0], xy[i][1]))
+    if len(order) < 3:
+        return [normalize_edge(order[0], order[1])] if len(order) == 2 else []
+
+    def half(seq):
+        chain = []
+        for p in seq:
+            while len(chain) >= 2 and orient(xy, chain[-2], chain[-1], p) < 0:
+                chain.pop()
+            chain.append(p)
+        return chain
+
+    lower = half(order)
+    upper = half(reversed(order))
+    cycle = lower[:-1] + upper[:-1]
+    return [normalize_edge(cycle[i], cycle[(i + 1) % len(cycle)]) for i in range(len(cycle))]
+
+
+def coords_from_points(points) -> list[tuple[int, int]]:
+    """Point objects (x()/y()) or (x, y) pairs -> integer coordinate list."""
+    xy = []
+    for p in points:
+        x, y = (p.x(), p.y()) if hasattr(p, "x") else p
+        x, y = float(x), float(y)
+        if not (x.is_integer() and y.is_integer()):
+            raise ValueError("HalfEdgeTriangulation needs integer coordinates")
+        xy.append((int(x), int(y)))
+    return xy
+
+
+def coords_of(t) -> list[tuple[int, int]]:
+    """Integer coordinates of the points of a HalfEdgeTriangulation or FlippableTriangulation."""
+    if hasattr(t, "_xy"):
+        return t._xy
+    return coords_from_points(t._flip_map.points)
+
+
+# =========================================================
+# HalfEdgeTriangulation
+# =========================================================
+
+class HalfEdgeTriangulation:
+    """
+    NumPy-backed triangle-adjacency triangulation with the same interface as
+    FlippableTriangulation (fork/add_flip/commit/get_flip_partner/possible_flips/get_edges).
+
+    _tv[t]    - the three vertices of triangle t in ccw order
+    _tn[t, i] - the triangle across the edge opposite _tv[t, i] (-1 on the hull)
+    _slot[e]  - (t, i) such that e is the edge of t opposite _tv[t, i]
+    _vt[v]    - some triangle that has v as a corner (-1 for unused points)
+
+    _flips    - the edges flippable in the committed state, patched after every flip
+                (only the quad around a flipped edge can change)
+
+    get_flip_partner / add_flip are O(1), fork copies two small int arrays and a dict.
+    possible_flips() is a live O(1)-membership view on _flips (see FlipSet).
+    Like the library class, flips are queued with add_flip and executed by commit;
+    two queued flips may not share a triangle.
+    speculate() gives a fork-like overlay whose flips are undone on rollback().
+    """
+
+    def __init__(self, xy, tv, tn, slot, hull, flips=None, frozen=frozenset(), vt=None):
+        self._xy = xy
+        self._frozen = frozen
+        self._tv = tv
+        self._tn = tn
+        self._slot = slot
+        if vt is None:
+            vt = np.full(len(xy), -1, dtype=np.int32)
+            vt[tv.ravel()] = np.repeat(np.arange(len(tv), dtype=np.int32), 3)
+        self._vt = vt
+        self._hull = hull
+        self._queue = []
+        self._busy = set()
+        self._undo = []
+        self._coords = None
+        if flips is None:
+            flips = set()
+            self._flips = flips
+            self._refresh_flips(slot)
+        self._flips = flips
+
+    # ---------- construction ----------
+
+    @classmethod
+    def from_points_edges(cls, points, edges, frozen=()):
+        """
+        Builds the triangulation from points and its interior edges (hull edges are added).
+        frozen: edges that are never flippable (e.g. the boundary of a region kernel).
+        The edges need not fill the hull; faces that are not triangles are left out,
+        and their edges behave like hull edges.
+        """
+        xy = coords_from_points(points)
+        hull = frozenset(convex_hull_edges(xy))
+        all_edges = {normalize_edge(*e) for e in edges} | hull
+
+        nbrs = defaultdict(list)
+        for u, v in all_edges:
+            nbrs[u].append(v)
+            nbrs[v].append(u)
+
+        for u, lst in nbrs.items():
+            ux, uy = xy[u]
+
+            def ccw_cmp(p, q, ux=ux, uy=uy):
+                ax, ay = xy[p][0] - ux, xy[p][1] - uy
+                bx, by = xy[q][0] - ux, xy[q][1] - uy
+                ha = 0 if (ay > 0 or (ay == 0 and ax > 0)) else 1
+                hb = 0 if (by > 0 or (by == 0 and bx > 0)) else 1
+                if ha != hb:
+                    return ha - hb
+                c = ax * by - ay * bx
+                return -1 if c > 0 else (1 if c < 0 else 0)
+
+            lst.sort(key=cmp_to_key(ccw_cmp))
+
+        pos = {u: {v: k for k, v in enumerate(lst)} for u, lst in nbrs.items()}
+
+        # walking faces: the face left of u->v continues at v with the neighbour before u
+        triangles = []
+        seen = set()
+        for u0, v0 in list(all_edges) + [(v, u) for u, v in all_edges]:
+            if (u0, v0) in seen:
+                continue
+            face = []
+            u, v = u0, v0
+            while (u, v) not in seen:
+                seen.add((u, v))
+                face.append(u)
+                lst = nbrs[v]
+                w = lst[pos[v][u] - 1]
+                u, v = v, w
+            if len(face) == 3 and orient(xy, *face) > 0:
+                triangles.append(face)
+
+        tv = np.array(triangles, dtype=np.int32).reshape(-1, 3)
+        tn = np.full(tv.shape, -1, dtype=np.int32)
+        directed = {}
+        for t, (p0, p1, p2) in enumerate(triangles):
+            directed[(p1, p2)] = (t, 0)
+            directed[(p2, p0)] = (t, 1)
+            directed[(p0, p1)] = (t, 2)
+
+        slot = {}
+        for (p, q), (t, i) in directed.items():
+            other = directed.get((q, p))
+            if other is not None:
+                tn[t, i] = other[0]
+            slot.setdefault(normalize_edge(p, q), (t, i))
+
+        return cls(xy, tv, tn, slot, hull, frozen=frozenset(normalize_edge(*e) for e in frozen))
+
+    @classmethod
+    def from_flippable(cls, t):
+        """Converts a cgshop2026_pyutils FlippableTriangulation (committed state only)."""
+        return cls.from_points_edges(t._flip_map.points, t.get_edges())
+
+    @classmethod
+    def from_instance(cls, instance) -> list['HalfEdgeTriangulation']:
+        """Builds one triangulation per entry of instance.triangulations."""
+        points = list(zip(instance.points_x, instance.points_y))
+        return [cls.from_points_edges(points, edges) for edges in instance.triangulations]
+
+    def fork(self) -> 'HalfEdgeTriangulation':
+        """Copy of the committed state (pending flips are not carried over)."""
+        dup = HalfEdgeTriangulation(self._xy, self._tv.copy(), self._tn.copy(),
+                                    self._slot.copy(), self._hull, set(self._flips), self._frozen,
+                                    self._vt.copy())
+        dup._coords = self._coords
+        return dup
+
+    # ---------- queries ----------
+
+    def _quad(self, e):
+        """(t, i, t2, j) for the interior edge e, raises ValueError otherwise."""
+        if e in self._frozen:
+            raise ValueError(f"Edge {e} is frozen")
+        try:
+            t, i = self._slot[e]
+        except KeyError:
+            raise ValueError(f"Edge {e} is not in the triangulation")
+        t2 = int(self._tn[t, i])
+        if t2 < 0:
+            raise ValueError(f"Edge {e} is on the convex hull")
+        row = self._tn[t2]
+        j = 0 if row[0] == t else (1 if row[1] == t else 2)
+        return t, i, t2, j
+
+    def _flippable(self, t, i, t2, j) -> bool:
+        tv = self._tv
+        v, a, b = tv[t, i], tv[t, (i + 1) % 3], tv[t, (i + 2) % 3]
+        z = tv[t2, j]
+        return orient(self._xy, v, z, a) * orient(self._xy, v, z, b) < 0
+
+    def get_flip_partner(self, edge) -> tuple[int, int]:
+        e = normalize_edge(*edge)
+        t, i, t2, j = self._quad(e)
+        if not self._flippable(t, i, t2, j):
+            raise ValueError(f"Edge {e} is not flippable")
+        return normalize_edge(int(self._tv[t, i]), int(self._tv[t2, j]))
+
+    def get_edges(self) -> list[tuple[int, int]]:
+        return [e for e in self._slot if e not in self._hull]
+
+    def triangles(self) -> list[tuple[int, int, int]]:
+        """Vertex triples of all triangles, each in ccw order."""
+        return [tuple(int(x) for x in row) for row in self._tv]
+
+    def crossing_edges(self, u, v) -> list[tuple[int, int]]:
+        """
+        The edges crossed by the segment u-v, in order from u, found by walking from
+        a triangle at u (_vt) around u and then across the crossed edges.
+        [] if u-v is an edge; ValueError if the segment runs through another point
+        or leaves the triangulated area.
+        """
+        xy, tv, tn = self._xy, self._tv, self._tn
+        if normalize_edge(u, v) in self._slot:
+            return []
+        start = int(self._vt[u])
+        if start < 0:
+            raise ValueError(f"Point {u} is not in the triangulation")
+
+        # סיבוב סביב u עד המשולש שהקטע יוצא דרך הצלע שמול u
+        found = None
+        for step in (1, 2):  # נגד כיוון השעון, ואם נתקענו בשפה - עם כיוון השעון
+            t = start
+            for _ in range(len(tv)):
+                k = 0 if tv[t, 0] == u else (1 if tv[t, 1] == u else 2)
+                p, q = int(tv[t, (k + 1) % 3]), int(tv[t, (k + 2) % 3])
+                op, oq = orient(xy, u, p, v), orient(xy, u, q, v)
+                for w, o in ((p, op), (q, oq)):
+                    if o == 0 and ((xy[w][0] - xy[u][0]) * (xy[v][0] - xy[u][0])
+                                   + (xy[w][1] - xy[u][1]) * (xy[v][1] - xy[u][1])) > 0:
+                        raise ValueError(f"Segment {(u, v)} runs through point {w}")
+                if op > 0 and oq < 0:
+                    found = t, k
+                    break
+                t = int(tn[t, (k + step) % 3])
+                if t < 0 or t == start:
+                    break
+            if found is not None:
+                break
+        if found is None:
+            raise ValueError(f"Segment {(u, v)} leaves the triangulation")
+
+        t, k = found
+        p, q = int(tv[t, (k + 1) % 3]), int(tv[t, (k + 2) % 3])
+        crossed = []
+        while True:
+            crossed.append(normalize_edge(p, q))
+            t2 = int(tn[t, k])
+            if t2 < 0:
+                raise ValueError(f"Segment {(u, v)} leaves the triangulation")
+            row = tn[t2]
+            j = 0 if row[0] == t else (1 if row[1] == t else 2)
+            r = int(tv[t2, j])
+            if r == v:
+                return crossed
+            side = orient(xy, u, v, r)
+            if side == 0:
+                raise ValueError(f"Segment {(u, v)} runs through point {r}")
+            # r מחליף את הקודקוד שבאותו צד של הקטע
+            if side == orient(xy, u, v, p):
+                p, r = r, p
+            else:
+                q, r = r, q
+            k = 0 if tv[t2, 0] == r else (1 if tv[t2, 1] == r else 2)
+            t = t2
+
+    def flippable_mask(self, edges) -> np.ndarray:
+        """
+        Batch get_flip_partner() test on the committed state: True where the edge is an
+        interior edge with a strictly convex quad. No exceptions are raised; edges that
+        are missing or on the hull come out False. Pending flips are ignored.
+        """
+        slots = [None if e in self._frozen else self._slot.get(e) for e in edges]
+        mask = np.zeros(len(slots), dtype=bool)
+        present = np.fromiter((s is not None for s in slots), dtype=bool, count=len(slots))
+        if not present.any():
+            return mask
+        ti = np.array([s for s in slots if s is not None], dtype=np.int64)
+        t, i = ti[:, 0], ti[:, 1]
+        t2 = self._tn[t, i].astype(np.int64)
+        interior = t2 >= 0
+        t, i, t2 = t[interior], i[interior], t2[interior]
+        j = np.argmax(self._tn[t2] == t[:, None], axis=1)
+        v = self._tv[t, i]
+        a = self._tv[t, (i + 1) % 3]
+        b = self._tv[t, (i + 2) % 3]
+        z = self._tv[t2, j]
+        if self._coords is None:
+            self._coords = coord_array(self._xy)
+        convex = orient_batch(self._coords, v, z, a) * orient_batch(self._coords, v, z, b) < 0
+        idx = np.flatnonzero(present)[interior]
+        mask[idx] = convex
+        return mask
+
+    def possible_flips(self) -> 'FlipSet':
+        return FlipSet(self, self._busy)
+
+    def _refresh_flips(self, edges):
+        """Recomputes membership in _flips for the given edges."""
+        flips = self._flips
+        for e in edges:
+            try:
+                quad = self._quad(e)
+            except ValueError:
+                flips.discard(e)
+                continue
+            if self._flippable(*quad):
+                flips.add(e)
+            else:
+                flips.discard(e)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, HalfEdgeTriangulation):
+            return self._slot.keys() == other._slot.keys()
+        return set(self.get_edges()) == {normalize_edge(*e) for e in other.get_edges()} - self._hull
+
+    __hash__ = None
+
+    # ---------- flips ----------
+
+    def add_flip(self, edge) -> tuple[int, int]:
+        return self._enqueue(edge, self._queue, self._busy)
+
+    def _enqueue(self, edge, queue, busy) -> tuple[int, int]:
+        e = normalize_edge(*edge)
+        if e in queue:
+            raise ValueError(f"Edge {e} is already in the flip queue")
+        t, i, t2, j = self._quad(e)
+        if t in busy or t2 in busy:
+            raise ValueError(f"Flip of {e} conflicts with a queued flip")
+        if not self._flippable(t, i, t2, j):
+            raise ValueError(f"Edge {e} is not flippable")
+        queue.append(e)
+        busy.add(t)
+        busy.add(t2)
+        return normalize_edge(int(self._tv[t, i]), int(self._tv[t2, j]))
+
+    def commit(self):
+        for e in self._queue:
+            self._flip(e)
+        self._queue.clear()
+        self._busy.clear()
+
+    def speculate(self) -> 'SpeculativeFlips':
+        return SpeculativeFlips(self)
+
+    def _flip(self, e, log=None) -> tuple[int, int]:
+        """Flips e immediately (no checks), returns the new edge. With log, pushes an undo record."""
+        tv, tn, slot = self._tv, self._tn, self._slot
+        t, i, t2, j = self._quad(e)
+        v, a, b = int(tv[t, i]), int(tv[t, (i + 1) % 3]), int(tv[t, (i + 2) % 3])
+        z = int(tv[t2, j])
+        n_va = int(tn[t, (i + 2) % 3])
+        n_bv = int(tn[t, (i + 1) % 3])
+        n_zb = int(tn[t2, (j + 2) % 3])
+        n_az = int(tn[t2, (j + 1) % 3])
+        if log is not None:
+            rows = [t, t2]
+            log.append((t, t2, tv[rows], tn[rows], n_az, n_bv))
+
+        # quad v, a, z, b (ccw) -> triangles (v, a, z) and (z, b, v)
+        tv[t] = (v, a, z)
+        tn[t] = (n_az, t2, n_va)
+        tv[t2] = (z, b, v)
+        tn[t2] = (n_bv, t, n_zb)
+        if n_az >= 0:
+            row = tn[n_az]
+            row[0 if row[0] == t2 else (1 if row[1] == t2 else 2)] = t
+        if n_bv >= 0:
+            row = tn[n_bv]
+            row[0 if row[0] == t else (1 if row[1] == t else 2)] = t2
+
+        self._vt[a] = t
+        self._vt[b] = t2
+        del slot[e]
+        new_edge = normalize_edge(v, z)
+        slot[normalize_edge(a, z)] = (t, 0)
+        slot[new_edge] = (t, 1)
+        slot[normalize_edge(v, a)] = (t, 2)
+        slot[normalize_edge(b, v)] = (t2, 0)
+        slot[normalize_edge(z, b)] = (t2, 2)
+        self._flips.discard(e)
+        self._refresh_flips((new_edge, normalize_edge(a, z), normalize_edge(v, a),
+                             normalize_edge(b, v), normalize_edge(z, b)))
+        return new_edge
+
+    def _rollback(self, mark: int):
+        """Undoes logged flips until only `mark` records are left (each undo is O(1))."""
+        tv, tn, slot = self._tv, self._tn, self._slot
+        while len(self._undo) > mark:
+            t, t2, old_tv, old_tn, n_az, n_bv = self._undo.pop()
+            new_edge = normalize_edge(int(tv[t, 0]), int(tv[t, 2]))
+            del slot[new_edge]
+            self._flips.discard(new_edge)
+            tv[t], tv[t2] = old_tv
+            tn[t], tn[t2] = old_tn
+            self._vt[old_tv[0]] = t
+            self._vt[old_tv[1]] = t2
+            if n_az >= 0:
+                row = tn[n_az]
+                row[0 if row[0] == t else (1 if row[1] == t else 2)] = t2
+            if n_bv >= 0:
+                row = tn[n_bv]
+                row[0 if row[0] == t2 else (1 if row[1] == t2 else 2)] = t
+            touched = []
+            for tt in (t, t2):
+                p0, p1, p2 = (int(x) for x in tv[tt])
+                touched += [normalize_edge(p1, p2), normalize_edge(p2, p0), normalize_edge(p0, p1)]
+                slot[touched[-3]] = (tt, 0)
+                slot[touched[-2]] = (tt, 1)
+                slot[touched[-1]] = (tt, 2)
+            self._refresh_flips(touched)
+
+
+class SpeculativeFlips:
+    """
+    Fork-like overlay on a HalfEdgeTriangulation for trial flips.
+    Committed flips are applied to the base in place and recorded on its undo stack;
+    rollback() restores the base in O(#flips). Pending flips of the base are ignored,
+    exactly like fork(). Overlays nest (speculate() on an overlay) and must be rolled back LIFO.
+    """
+
+    def __init__(self, base: HalfEdgeTriangulation):
+        self._base = base
+        self._mark = len(base._undo)
+        self._queue = []
+        self._busy = set()
+
+    def get_flip_partner(self, edge) -> tuple[int, int]:
+        return self._base.get_flip_partner(edge)
+
+    def get_edges(self) -> list[tuple[int, int]]:
+        return self._base.get_edges()
+
+    def possible_flips(self) -> 'FlipSet':
+        return FlipSet(self._base, self._busy)
+
+    def flippable_mask(self, edges) -> np.ndarray:
+        return self._base.flippable_mask(edges)
+
+    def add_flip(self, edge) -> tuple[int, int]:
+        return self._base._enqueue(edge, self._queue, self._busy)
+
+    def commit(self):
+        for e in self._queue:
+            self._base._flip(e, self._base._undo)
+        self._queue.clear()
+        self._busy.clear()
+
+    def fork(self) -> HalfEdgeTriangulation:
+        return self._base.fork()
+
+    def speculate(self) -> 'SpeculativeFlips':
+        return SpeculativeFlips(self._base)
+
+    def rollback(self):
+        self._queue.clear()
+        self._busy.clear()
+        self._base._rollback(self._mark)
+
+    def __eq__(self, other) -> bool:
+        return self._base.__eq__(other._base if isinstance(other, SpeculativeFlips) else other)
+
+    __hash__ = None
+
+
+class FlipSet:
+    """
+    possible_flips() of a HalfEdgeTriangulation: the cached flippable edges minus the
+    ones touching a triangle of a pending flip. Membership is O(1); the view is live,
+    so it reflects later add_flip/commit calls. Iteration works on a snapshot.
+    """
+    __slots__ = ("_tri", "_busy")
+
+    def __init__(self, tri: HalfEdgeTriangulation, busy: set):
+        self._tri = tri
+        self._busy = busy
+
+    def __contains__(self, edge) -> bool:
+        tri = self._tri
+        if edge not in tri._flips:
+            return False
+        if not self._busy:
+            return True
+        t, i = tri._slot[edge]
+        return t not in self._busy and int(tri._tn[t, i]) not in self._busy
+
+    def __iter__(self):
+        return iter([e for e in self._tri._flips if e in self])
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def as_backend(t, backend: str):
+    """Returns t converted to the requested backend ("flippable" keeps it as is)."""
+    if backend == "flippable" or isinstance(t, HalfEdgeTriangulation):
+        return t
+    if backend == "halfedge":
+        return HalfEdgeTriangulation.from_flippable(t)
+    raise ValueError(f"Unknown backend {backend!r}")
@@ -4,6 +4,7 @@ from pathlib import Path
 import matplotlib.pyplot as plt
 import random
 from collections import defaultdict
+from contextlib import contextmanager
 from cgshop2026_pyutils.io import read_instance
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
@@ -24,10 +25,41 @@ def isFree(a: FlippableTriangulation, set_b: set[tuple[int, int]],edge:tuple[int
     return False
 
 
+class ChangedEdgeTracker:
+    """
+    The edges of a working triangulation that are not in the target, kept up to date
+    from the committed flips (O(1) per flip) instead of rescanning get_edges().
+    Both triangulations have the same number of edges, so the working one equals
+    the target exactly when mismatch == 0.
+    Edges may be normalized tuples or EdgeUniverse ids, as long as set_b uses the same kind.
+    """
+
+    def __init__(self, edges_a, set_b: set):
+        self.set_b = set_b
+        self.edges = set(edges_a) - set_b
+
+    def commit(self, flips_with_partner):
+        """flips_with_partner: (old_edge, new_edge) pairs of one committed layer."""
+        for e, flip_rev in flips_with_partner:
+            self.edges.discard(e)
+            if flip_rev not in self.set_b:
+                self.edges.add(flip_rev)
+
+    @property
+    def mismatch(self) -> int:
+        return len(self.edges)
+
+
 def normalize_edge(u, v):
     """Return the edge in a canonical form (smallest vertex first)."""
     return (min(u, v), max(u, v))
 
+def quad_edges(e: tuple[int,int], flip_rev: tuple[int,int]) -> list[tuple[int,int]]:
+    """The edges whose triangles change when e is flipped into flip_rev (both diagonals + 4 sides)."""
+    u, w = e
+    v, z = flip_rev
+    return [e, flip_rev, normalize_edge(u, v), normalize_edge(v, w), normalize_edge(w, z), normalize_edge(z, u)]
+
 def new_triangles(a: FlippableTriangulation, e: tuple[int,int]):
     u, w = e
     v, z = a.get_flip_partner(e)
@@ -60,43 +92,103 @@ def reconstruct_triangulation_sequence(a: FlippableTriangulation, flips_by_layer
     return sequence
 
 
-def independent_set(a: FlippableTriangulation, edges):
-    try:
-        a_tmp = a.fork()
-        for e in edges:
-            a_tmp.add_flip(e)
-        a_tmp.commit()
-        return True
-    except ValueError:
-        return False
+def schedule_pairs(a: FlippableTriangulation, flips_by_layer):
+    """
+    Replays flips_by_layer from a and returns the matching flips_with_partner layers
+    (every flip paired with the edge it creates). Raises ValueError if a flip is invalid.
+    """
+    current = a.fork()
+    pairs_by_layer = []
+    for layer_flips in flips_by_layer:
+        pairs = set()
+        for e in layer_flips:
+            e = normalize_edge(*e)
+            f = normalize_edge(*current.get_flip_partner(e))
+            current.add_flip(e)
+            pairs.add((e, f))
+        current.commit()
+        pairs_by_layer.append(pairs)
+    return pairs_by_layer
+
+
+def reverse_schedule(flips_with_partner_by_layer):
+    """
+    The schedule that goes back: layers in reverse order, each flip replaced by the
+    flip of the edge it created. Returns (flips_by_layer, flips_with_partner_by_layer).
+    """
+    pairs = [{(f, e) for e, f in layer} for layer in reversed(flips_with_partner_by_layer)]
+    return [{e for e, _ in layer} for layer in pairs], pairs
 
-def maximal_independent_subsets(a: FlippableTriangulation, candidates):
+
+@contextmanager
+def speculation(a):
     """
-    מחזירה רשימה של תתי-קבוצות בלתי תלויות מקסימליות
+    Scratch copy of a for trial flips (fork semantics).
+    On a HalfEdgeTriangulation this is an undo-log overlay that is rolled back on exit,
+    so nothing is copied; any other triangulation is simply forked.
     """
-    subsets = []
+    if hasattr(a, "speculate"):
+        a_tmp = a.speculate()
+        try:
+            yield a_tmp
+        finally:
+            a_tmp.rollback()
+    else:
+        yield a.fork()
 
-    for start in candidates:
-        current = {start}
-        a_tmp = a.fork()
+
+def flip_set(a) -> set:
+    """
+    possible_flips() of a as something with O(1) membership.
+    A HalfEdgeTriangulation already returns a live FlipSet; other backends return a
+    list, which is turned into a set (a snapshot, so add_flip may still reject a member).
+    """
+    flips = a.possible_flips()
+    return set(flips) if isinstance(flips, list) else flips
+
+
+def independent_set(a: FlippableTriangulation, edges):
+    with speculation(a) as a_tmp:
         try:
-            a_tmp.add_flip(start)
+            for e in edges:
+                a_tmp.add_flip(e)
             a_tmp.commit()
+            return True
         except ValueError:
-            continue
+            return False
 
-        for e in candidates:
-            if e in current:
-                continue
+def maximal_independent_subsets(a: FlippableTriangulation, candidates):
+    """
+    מחזירה רשימה של תתי-קבוצות בלתי תלויות מקסימליות
+    """
+    subsets = []
+    candidates = list(candidates)
+    starts = candidates
+    if hasattr(a, "flippable_mask"):
+        # סינון מראש של קשתות שאי אפשר להפוך, בלי add_flip/ValueError לכל אחת
+        mask = a.flippable_mask([normalize_edge(*e) for e in candidates])
+        starts = [e for e, ok in zip(candidates, mask) if ok]
+
+    for start in starts:
+        current = {start}
+        with speculation(a) as a_tmp:
             try:
-                a_try = a_tmp.fork()
-                a_try.add_flip(e)
-                a_try.commit()
-                current.add(e)
-                a_tmp = a_try
+                a_tmp.add_flip(start)
+                a_tmp.commit()
             except ValueError:
                 continue
 
+            for e in candidates:
+                if e in current:
+                    continue
+                try:
+                    # a failed add_flip leaves nothing queued, so no extra fork is needed
+                    a_tmp.add_flip(e)
+                    a_tmp.commit()
+                    current.add(e)
+                except ValueError:
+                    continue
+
         subsets.append(current)
 
     return subsets
@@ -0,0 +1,94 @@
+from cgshop2026_pyutils.geometry import FlippableTriangulation
+
+from helpFuncs import normalize_edge, flip_set
+from halfedge import as_backend
+from segment_index import SegmentIndex, segments_cross
+from edge_universe import EdgeUniverse
+
+
+# =========================================================
+# מנוע הכנסת קשתות: עובדים מצד המטרה
+# =========================================================
+
+class EdgeInsertionSolver:
+    """
+    Works from the target side: every edge f of b that is still missing has a chain
+    of crossing edges (HalfEdgeTriangulation.crossing_edges walks it from a triangle
+    at one endpoint), and the engine flips chain edges away until f appears.
+    In each layer the missing edges are visited with the shortest chains first and
+    their chain flips are queued as long as they do not share a triangle, so
+    insertions in disjoint parts of the triangulation run in the same layer.
+
+    Only flips that lower the number of (edge, target edge) crossings are taken.
+    Some such flip always exists while a != b (Hanke, Ottmann, Schuierer) and it lies
+    on a chain, so every layer makes progress and the number of layers is at most
+    the crossing count of a and b - no layer limit is needed. Target edges cross no
+    other target edge, so once inserted they are never on a chain again (frozen).
+    """
+
+    def __init__(self, a: FlippableTriangulation,
+                 b: FlippableTriangulation,
+                 universe: EdgeUniverse = None):
+        self.a = as_backend(a, "halfedge").fork()
+        self.U = universe if universe is not None else EdgeUniverse()
+        self.set_b = {normalize_edge(*e) for e in b.get_edges()}
+        self.index = SegmentIndex(self.a._xy, self.set_b)
+        self.cross = {}
+        self.layers = 0
+
+    def crossings(self, e) -> int:
+        c = self.cross.get(e)
+        if c is None:
+            c = self.cross[e] = self.index.count(*e)
+        return c
+
+    def _layer(self, t, missing) -> set[tuple[tuple[int, int], tuple[int, int]]]:
+        """Queues one layer of chain flips on t, returns the (edge, partner) pairs."""
+        chains = sorted((len(chain), f, chain) for f in missing
+                        for chain in [t.crossing_edges(*f)])
+        flips = flip_set(t)
+        chosen = set()
+        for _, f, chain in chains:
+            candidates = []
+            for e in chain:
+                if e not in flips:
+                    continue
+                partner = t.get_flip_partner(e)
+                gain = self.crossings(e) - self.crossings(partner)
+                if gain > 0:
+                    # קודם היפוך שיוצר את f, אחר כך כזה שמקצר את השרשרת, ואז לפי הרווח
+                    candidates.append((partner != f, segments_cross(t._xy, partner, f), -gain, e, partner))
+            for *_, e, partner in sorted(candidates):
+                try:
+                    t.add_flip(e)
+                except ValueError:
+                    continue
+                chosen.add((e, partner))
+        return chosen
+
+    def solve(self):
+        """(dist, flips_by_layer, flips_with_partner_by_layer) like distance()."""
+        t = self.a
+        missing = self.set_b - set(t.get_edges())
+        flips_by_layer = []
+        flips_with_partner_by_layer = []
+        while missing:
+            layer = self._layer(t, missing)
+            if not layer:
+                raise ValueError("no crossing-reducing flip - a and b do not triangulate the same region")
+            t.commit()
+            for e, f in layer:
+                self.U.intern(*e)
+                self.U.intern(*f)
+                missing.discard(f)
+            flips_by_layer.append({e for e, _ in layer})
+            flips_with_partner_by_layer.append(layer)
+        self.layers = len(flips_by_layer)
+        return self.layers, flips_by_layer, flips_with_partner_by_layer
+
+
+def insertion_distance(a: FlippableTriangulation,
+                       b: FlippableTriangulation,
+                       universe: EdgeUniverse = None):
+    """Thin wrapper around EdgeInsertionSolver."""
+    return EdgeInsertionSolver(a, b, universe).solve()
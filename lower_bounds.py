@@ -0,0 +1,85 @@
+import math
+from functools import partial
+
+from cgshop2026_pyutils.geometry import FlippableTriangulation
+
+from helpFuncs import normalize_edge
+from halfedge import coords_of
+from segment_index import crossing_counts
+
+
+# =========================================================
+# חסמים תחתונים (קבילים) למרחק ההיפוכים המקבילי
+# =========================================================
+
+def _crossing_bound(count, edges_a: set, edges_b: set) -> int:
+    """count(edges, targets): crossing_counts with the geometry already bound."""
+    best = 0
+    for source, target in ((edges_a, edges_b), (edges_b, edges_a)):
+        missing = sorted(target - source)
+        if missing:
+            c = int(count(source, missing).max())
+            best = max(best, math.ceil(math.log2(c + 1)))
+    return best
+
+
+def _layer_bound(a, edges_a: set, edges_b: set) -> int:
+    wrong = edges_a - edges_b
+    if not wrong:
+        return 0
+    partners = set()
+    for e in wrong:
+        try:
+            partners.add(normalize_edge(*a.get_flip_partner(e)))
+        except ValueError:
+            return 2
+    return 1 if (edges_b - edges_a) <= partners else 2
+
+
+def crossing_bound(a: FlippableTriangulation, b: FlippableTriangulation) -> int:
+    """
+    max over target edges f of ceil(log2(c(f) + 1)), c(f) = edges of a crossing f,
+    taken in both directions. The edges crossing f, in their order along f, share a
+    triangle pairwise consecutively, so one parallel layer removes at most ceil(c/2)
+    of them: at least floor(c/2) are left, and c reaches 0 after no fewer layers.
+    """
+    return _crossing_bound(partial(crossing_counts, coords_of(a)),
+                           {normalize_edge(*e) for e in a.get_edges()},
+                           {normalize_edge(*e) for e in b.get_edges()})
+
+
+def layer_bound(a: FlippableTriangulation, b: FlippableTriangulation) -> int:
+    """
+    0 if a == b, 1 if one layer could finish, otherwise 2: some wrong edge of a
+    cannot be flipped now, or some missing edge of b is not created by flipping a
+    wrong edge (how deep the target sits behind blocking edges, cut at depth 2).
+    """
+    return _layer_bound(a, {normalize_edge(*e) for e in a.get_edges()},
+                        {normalize_edge(*e) for e in b.get_edges()})
+
+
+def state_bound(t, set_b: set, xy=None) -> int:
+    """
+    lower_bound of the state t against the target edge set set_b, for searches that
+    keep only the target's edges (ExactDistanceSolver). Without coordinates (xy=None)
+    the crossings come from t.crossing_counts if it has one (ConvexTriangulation),
+    otherwise only the layer bound is used.
+    When one layer could finish, every missing edge crosses just the edge it replaces,
+    so the crossing bound is at most 1 and is only computed past that.
+    """
+    edges = {normalize_edge(*e) for e in t.get_edges()}
+    bound = _layer_bound(t, edges, set_b)
+    if bound < 2:
+        return bound
+    if xy is not None:
+        count = partial(crossing_counts, xy)
+    elif hasattr(t, "crossing_counts"):
+        count = t.crossing_counts
+    else:
+        return bound
+    return max(bound, _crossing_bound(count, edges, set_b))
+
+
+def lower_bound(a: FlippableTriangulation, b: FlippableTriangulation) -> int:
+    """The best of the admissible bounds above."""
+    return state_bound(a, {normalize_edge(*e) for e in b.get_edges()}, coords_of(a))
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from helpFuncs import normalize_edge, reverse_schedule
+
+
+# =========================================================
+# מאגר תוצאות על הדיסק (SQLite) - התחלה חמה בין ריצות
+# =========================================================
+
+class ResultsStore:
+    """
+    Best known (dist, schedule) per pair of triangulations, kept in one SQLite file
+    so long campaigns continue from earlier runs instead of starting over.
+    Rows are keyed by (instance uid, hash of edge set a, hash of edge set b) and hold
+    the flips_with_partner layers as JSON; a pair asked for in the other direction is
+    served by reversing the schedule. put() only ever replaces a row with a shorter one.
+    """
+
+    def __init__(self, path: str = "results.sqlite", instance_uid: str = ""):
+        self.path = path
+        self.instance_uid = instance_uid
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pairs ("
+            " instance_uid TEXT, key_a TEXT, key_b TEXT,"
+            " dist INTEGER, schedule TEXT, updated REAL,"
+            " PRIMARY KEY (instance_uid, key_a, key_b))")
+        self.conn.commit()
+
+    @staticmethod
+    def edge_hash(edges) -> str:
+        """Order-independent hash of an edge set."""
+        canon = sorted(normalize_edge(*e) for e in edges)
+        return hashlib.sha1(json.dumps(canon).encode()).hexdigest()
+
+    def get(self, edges_a, edges_b):
+        """(dist, flips_by_layer, flips_with_partner_by_layer) from a to b, or None."""
+        key_a, key_b = self.edge_hash(edges_a), self.edge_hash(edges_b)
+        reverse = key_a > key_b
+        if reverse:
+            key_a, key_b = key_b, key_a
+        row = self.conn.execute(
+            "SELECT dist, schedule FROM pairs WHERE instance_uid = ? AND key_a = ? AND key_b = ?",
+            (self.instance_uid, key_a, key_b)).fetchone()
+        if row is None:
+            return None
+        dist, schedule = row
+        pairs = [{(tuple(e), tuple(f)) for e, f in layer} for layer in json.loads(schedule)]
+        if reverse:
+            flips, pairs = reverse_schedule(pairs)
+        else:
+            flips = [{e for e, _ in layer} for layer in pairs]
+        return dist, flips, pairs
+
+    def put(self, edges_a, edges_b, dist: int, flips_with_partner_by_layer) -> bool:
+        """Stores the schedule (a to b) if it beats the stored one; returns True if it did."""
+        old = self.get(edges_a, edges_b)
+        if old is not None and old[0] <= dist:
+            return False
+        key_a, key_b = self.edge_hash(edges_a), self.edge_hash(edges_b)
+        pairs = flips_with_partner_by_layer
+        if key_a > key_b:
+            key_a, key_b = key_b, key_a
+            pairs = reverse_schedule(pairs)[1]
+        schedule = json.dumps([sorted([list(e), list(f)] for e, f in layer) for layer in pairs])
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?, ?)",
+            (self.instance_uid, key_a, key_b, dist, schedule, time.time()))
+        self.conn.commit()
+        return True
+
+    def close(self):
+        self.conn.close()
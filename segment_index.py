@@ -0,0 +1,132 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from helpFuncs import normalize_edge
+from halfedge import orient, coord_array, orient_batch
+
+
+# =========================================================
+# שאילתות חיתוך בין קטעים: מטריצה וקטורית + אינדקס רשת אחידה
+# =========================================================
+
+def segments_cross(xy, e, f) -> bool:
+    """Do the segments e and f cross in the interior of both (exact)."""
+    (p, q), (u, v) = e, f
+    if len({p, q, u, v}) < 4:
+        return False
+    return (orient(xy, u, v, p) * orient(xy, u, v, q) < 0
+            and orient(xy, p, q, u) * orient(xy, p, q, v) < 0)
+
+
+def crossing_matrix(xy, edges_a, edges_b) -> np.ndarray:
+    """
+    Boolean (len(edges_a), len(edges_b)) matrix: does edge a_i cross edge b_j in the
+    interior of both. Segments sharing an endpoint never cross. Exact integer tests.
+    """
+    A = np.array([normalize_edge(*e) for e in edges_a], dtype=np.int64).reshape(-1, 2)
+    B = np.array([normalize_edge(*e) for e in edges_b], dtype=np.int64).reshape(-1, 2)
+    if len(A) == 0 or len(B) == 0:
+        return np.zeros((len(A), len(B)), dtype=bool)
+    coords = coord_array(xy)
+    p, q = np.repeat(A[:, 0], len(B)), np.repeat(A[:, 1], len(B))
+    u, v = np.tile(B[:, 0], len(A)), np.tile(B[:, 1], len(A))
+    free = (p != u) & (p != v) & (q != u) & (q != v)
+    cross = ((orient_batch(coords, u, v, p) * orient_batch(coords, u, v, q) < 0)
+             & (orient_batch(coords, p, q, u) * orient_batch(coords, p, q, v) < 0))
+    return (cross & free).reshape(len(A), len(B))
+
+
+def crossing_counts(xy, edges, targets, chunk: int = 1 << 22) -> np.ndarray:
+    """
+    For every target segment, how many of `edges` cross it. crossing_matrix() in
+    slices of targets, so at most ~chunk pairs are tested at once.
+    """
+    edges = list(edges)
+    targets = list(targets)
+    counts = np.zeros(len(targets), dtype=np.int64)
+    if not edges:
+        return counts
+    step = max(1, chunk // len(edges))
+    for s in range(0, len(targets), step):
+        counts[s:s + step] = crossing_matrix(xy, targets[s:s + step], edges).sum(axis=1)
+    return counts
+
+
+class SegmentIndex:
+    """
+    Uniform grid over the bounding box of the points; every segment is stored in
+    each cell it touches. A crossing query visits only the cells of the query
+    segment and tests the segments found there exactly, so its cost follows the
+    number of nearby segments rather than the size of the instance.
+    Cells have integer size, so the cell test (corners against the line) is exact
+    and never loses a candidate. Built once per instance, typically over the whole
+    EdgeUniverse; `among` restricts a query to one triangulation's edges.
+    """
+
+    def __init__(self, xy, edges=(), cells: int = None):
+        self.xy = xy
+        xs = [x for x, _ in xy]
+        ys = [y for _, y in xy]
+        self.x0, self.y0 = min(xs), min(ys)
+        span = max(max(xs) - self.x0, max(ys) - self.y0, 1)
+        edges = list(edges)
+        if cells is None:
+            cells = max(1, math.isqrt(max(len(edges), len(xy))))
+        self.size = -(-span // cells) or 1
+        self.grid = defaultdict(list)
+        self.segments = set()
+        for e in edges:
+            self.add(*e)
+
+    @classmethod
+    def from_universe(cls, xy, universe, cells: int = None) -> 'SegmentIndex':
+        return cls(xy, universe.edges(range(len(universe._edges))), cells)
+
+    def _cell_of(self, p) -> tuple[int, int]:
+        x, y = self.xy[p]
+        return (x - self.x0) // self.size, (y - self.y0) // self.size
+
+    def _cells(self, u, v):
+        """Every grid cell (closed square) the segment u-v touches."""
+        (cx0, cy0), (cx1, cy1) = self._cell_of(u), self._cell_of(v)
+        (ux, uy), (vx, vy) = self.xy[u], self.xy[v]
+        s = self.size
+        for cx in range(min(cx0, cx1), max(cx0, cx1) + 1):
+            for cy in range(min(cy0, cy1), max(cy0, cy1) + 1):
+                x, y = self.x0 + cx * s, self.y0 + cy * s
+                # הריבוע נוגע בישר אם לא כל הפינות בצד אחד (ממש) שלו
+                d = [(vx - ux) * (py - uy) - (vy - uy) * (px - ux)
+                     for px, py in ((x, y), (x + s, y), (x, y + s), (x + s, y + s))]
+                if min(d) <= 0 <= max(d):
+                    yield cx, cy
+
+    def add(self, u, v):
+        e = normalize_edge(u, v)
+        if e in self.segments:
+            return
+        self.segments.add(e)
+        for cell in self._cells(*e):
+            self.grid[cell].append(e)
+
+    def crossing(self, u, v, among=None) -> list[tuple[int, int]]:
+        """Indexed segments that cross u-v (only those in `among`, if given)."""
+        e = normalize_edge(u, v)
+        seen = set()
+        out = []
+        for cell in self._cells(*e):
+            for f in self.grid.get(cell, ()):
+                if f in seen:
+                    continue
+                seen.add(f)
+                if (among is None or f in among) and segments_cross(self.xy, e, f):
+                    out.append(f)
+        return out
+
+    def count(self, u, v, among=None) -> int:
+        return len(self.crossing(u, v, among))
+
+    def crossing_counts(self, targets, among=None) -> np.ndarray:
+        """crossing_counts() through the index: one query per target."""
+        return np.array([self.count(*f, among) for f in targets], dtype=np.int64)
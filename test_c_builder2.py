@@ -0,0 +1,41 @@
+from cgshop2026_pyutils.geometry import FlippableTriangulation, Point
+
+from c_builder2 import build_flip_components
+from edge_universe import EdgeUniverse
+from helpFuncs import normalize_edge
+
+
+# מופע של 30 נקודות שבו חיפוש ה-subset הישן דיווח על תלות שלא קיימת
+POINTS = [(6, 346), (41, 745), (64, 792), (82, 342), (113, 135), (141, 190), (160, 172), (209, 690),
+          (229, 743), (243, 52), (382, 273), (388, 173), (462, 974), (474, 627), (514, 474), (518, 892),
+          (567, 958), (631, 716), (704, 392), (720, 968), (742, 432), (791, 273), (808, 764), (812, 431),
+          (887, 692), (908, 104), (910, 89), (919, 619), (941, 298), (946, 604)]
+EDGES_A = [(0, 3), (1, 3), (1, 7), (1, 8), (1, 12), (3, 4), (3, 5), (3, 7), (3, 10), (3, 13), (4, 5), (4, 6),
+           (5, 6), (5, 10), (5, 11), (6, 9), (6, 11), (7, 8), (7, 13), (8, 12), (8, 13), (9, 11), (10, 11),
+           (10, 13), (10, 14), (11, 14), (11, 26), (12, 13), (12, 15), (12, 16), (13, 14), (13, 15), (13, 16),
+           (13, 17), (13, 19), (14, 17), (14, 18), (14, 20), (14, 21), (14, 22), (14, 26), (14, 27), (15, 16),
+           (16, 19), (17, 19), (17, 22), (18, 20), (18, 21), (19, 22), (19, 24), (19, 27), (20, 21), (20, 23),
+           (20, 27), (21, 23), (21, 25), (21, 26), (21, 28), (22, 27), (23, 27), (23, 28), (23, 29), (24, 27),
+           (24, 29), (25, 26), (25, 28), (27, 29)]
+LAYERS = [
+    {((1, 12), (2, 8)), ((12, 13), (8, 15)), ((14, 26), (11, 21))},
+    {((11, 26), (9, 21))},
+    {((8, 12), (2, 15))},
+]
+
+
+def test_flip_not_enabled_by_unrelated_previous_layer():
+    """
+    (8, 12) -> (2, 15) in layer 2 has its quadrilateral 8-2-12-15 since layer 0, so
+    nothing in layer 1 enables it. The old subset search started at size 1 and
+    reported the far-away (11, 26) flip of layer 1, which merely does not break it.
+    """
+    a = FlippableTriangulation.from_points_edges([Point(x, y) for x, y in POINTS], EDGES_A)
+    U = EdgeUniverse.from_triangulations([a])
+    dsu, comp_info, Trings = build_flip_components(LAYERS, a, universe=U)
+
+    node = (U.intern(8, 12), 2)
+    assert comp_info[node]["enabled"] == set()
+    assert dsu.find(node) != dsu.find((U.intern(11, 26), 1))
+    # הקשת כבר ניתנת להיפוך לאותו שותף אחרי שכבה 0
+    assert normalize_edge(*Trings[1].get_flip_partner((8, 12))) == (2, 15)
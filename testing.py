@@ -8,7 +8,9 @@ from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Poin
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
 from drawing import Draw_distance, Draw_Manager_Components ,Draw_triangulation
 from distance import distance
-from c_builder import ConnectedDirectedComponent, DynamicGraphManager, MakeComponents
+from c_builder import MakeComponents
+from results_store import ResultsStore
+from helpFuncs import schedule_pairs
 INSTANCE_FOLDER = "benchmark_instances"
 INSTANCE_FILENAME = "random_instance_881_320_10.json" 
 
@@ -37,6 +39,7 @@ def main():
         for x, y in zip(instance.points_x, instance.points_y)
     ]
     n = len(instance.triangulations)
+    store = ResultsStore(str(script_dir / "results.sqlite"), instance.instance_uid)
    
     for one in range(n):
         for two in range(one + 1, n): 
@@ -45,6 +48,9 @@ def main():
             triang2 = instance.triangulations[two]
             a: FlippableTriangulation = FlippableTriangulation.from_points_edges(points_list, triang1)
             b: FlippableTriangulation = FlippableTriangulation.from_points_edges(points_list, triang2)
+            stored = store.get(triang1, triang2)
+            if stored is not None:
+                print(f"  stored dist : {stored[0]}")
             
 
 
@@ -86,10 +92,8 @@ def main():
                 # print(f"Processing Global Layer {i} with {len(layer)} flips...")
                 stages_of_flips_comp.append(list())
                 
-                for node_id in layer:
-                    # node_id is (Edge_Before, Edge_After, ID)
-                    edge_to_flip = node_id[0]
-                    
+                for edge_to_flip in layer:
+                    # fromCompToFlips returns the edges to flip, layer by layer
                     try:
                         a_clone2.add_flip(edge_to_flip)
                         # FIX: Use 'i' (the index) instead of 'layer' (the list object)
@@ -103,6 +107,8 @@ def main():
                 a_clone2.commit()
             if(not a_clone2.__eq__(b)):
                 print(f"do the flips lead to b: {a_clone2.__eq__(b)}")
+            elif store.put(triang1, triang2, dist_comp, schedule_pairs(a, stages_of_flips_comp)):
+                print("  stored improved result")
             Draw_distance(dist_comp, stages_of_flips_comp, a,b,points_list)
             #Draw_Manager_Components(manager)
 if __name__ == "__main__":
@@ -6,6 +6,7 @@ from cgshop2026_pyutils.io import read_instance
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
 from cgshop2026_pyutils.schemas import CGSHOP2026Instance
 from closestTriangulation import closestTringulation , median_triangulation,dynamic_median_triangulation
+from results_store import ResultsStore
 
 #from c_builder2 import full_build_components
 INSTANCE_FOLDER = "benchmark_instances"
@@ -51,7 +52,8 @@ def main():
     #min_tiang = dynamic_median_triangulation(triangs)
 
     #triangs.append(min_tiang)
-    total_dist, closest_tri, dist_matrix,min_i = closestTringulation(triangs,True)
+    store = ResultsStore(str(script_dir / "results.sqlite"), instance.instance_uid)
+    total_dist, closest_tri, dist_matrix,min_i = closestTringulation(triangs,True,store)
     print(f"closest dist id {total_dist}")
     # שמירת הכל ל-PDF
     name_without_ext = Path(INSTANCE_FILENAME).stem
@@ -6,278 +6,289 @@ from collections import defaultdict, deque
 import networkx as nx
 from itertools import chain
 from cgshop2026_pyutils.geometry import FlippableTriangulation, draw_edges, Point 
-from helpFuncs import normalize_edge , new_triangles,diff,isFree,maximal_independent_subsets
-
-
-edge_attempt_count = defaultdict(int)
+from helpFuncs import normalize_edge , new_triangles,diff,isFree,maximal_independent_subsets,ChangedEdgeTracker,flip_set,reverse_schedule
+from halfedge import as_backend, coords_of, HalfEdgeTriangulation
+from fpt_distance import common_edge_regions, region_kernel
+from concurrent.futures import ProcessPoolExecutor
+from distance import blocking_edges, scored_edges, BlockingScoreCache, Huristic, is_free, DistanceSolver
+from edge_universe import EdgeUniverse
 
 # =========================================================
-# 1. Separator מישורי (ליפטון–טארג'ן על גרף קשתות משותפות)
+# 1. פירוק לאזורים לפי קשתות משותפות
 # =========================================================
 
-def find_barrier_path_fast(shared_edges, max_time_ms=200):
+def region_kernels(T1, T2):
     """
-    מחזיר שכבת BFS שמפרידה את גרף הקשתות המשותפות בערך לחצי
-    (Separator מישורי)
+    fpt_distance.region_kernel() of every region of common_edge_regions().
+    Yields (vertices, local_xy, local_edges_1, local_edges_2, local_frozen).
     """
-    if not shared_edges:
-        return None
+    xy = coords_of(T1)
+    for boundary, inside_1, inside_2 in common_edge_regions(T1, T2):
+        yield region_kernel(xy, boundary, inside_1, inside_2)
 
-    point_to_edges = defaultdict(list)
-    for e in shared_edges:
-        for p in e:
-            point_to_edges[p].append(e)
-
-    adj = defaultdict(set)
-    for edges in point_to_edges.values():
-        for i in range(len(edges)):
-            for j in range(i + 1, len(edges)):
-                adj[edges[i]].add(edges[j])
-                adj[edges[j]].add(edges[i])
-
-    start = next(iter(shared_edges))
-    level = {start: 0}
-    q = deque([start])
-    layers = defaultdict(list)
-
-    while q:
-        u = q.popleft()
-        layers[level[u]].append(u)
-        for v in adj[u]:
-            if v not in level:
-                level[v] = level[u] + 1
-                q.append(v)
-
-    total = len(shared_edges)
-    seen = 0
-    for i in sorted(layers):
-        seen += len(layers[i])
-        if total / 3 <= seen <= 2 * total / 3:
-            return set(layers[i])
-
-    return None
 
+def _solve_region(distance_func, vertices, local_xy, edges_1, edges_2, frozen, seed):
+    """
+    Runs distance_func on one region kernel and maps the layers back to global ids.
+    None if the run gave up (more than DistanceSolver.max_layers) or its schedule
+    does not replay to the second kernel.
+    """
+    k1 = HalfEdgeTriangulation.from_points_edges(local_xy, edges_1, frozen)
+    k2 = HalfEdgeTriangulation.from_points_edges(local_xy, edges_2, frozen)
+    d, flips, pairs = distance_func(k1, k2, seed=seed)
+    # ריצה שנעצרה ב-max_layers מחזירה לוח חלקי - רק לוח שמגיע ל-k2 נכנס למיזוג ולמטמון
+    if d > DistanceSolver.max_layers:
+        return None
+    end = k1.fork()
+    try:
+        for layer in flips:
+            for e in layer:
+                end.add_flip(e)
+            end.commit()
+    except ValueError:
+        return None
+    if set(end.get_edges()) != set(k2.get_edges()):
+        return None
 
-# =========================================================
-# 2. חלוקה לרכיבים קשירים אחרי הסרת המחסום
-# =========================================================
+    def glob(e):
+        return normalize_edge(vertices[e[0]], vertices[e[1]])
 
-def split_by_connected_components(T, barrier_edges):
-    all_edges = set(normalize_edge(*e) for e in T.get_edges())
-    barrier = set(barrier_edges)
-    remaining = all_edges - barrier
+    return (d,
+            [{glob(e) for e in layer} for layer in flips],
+            [{(glob(e), glob(f)) for e, f in layer} for layer in pairs])
 
-    if not remaining:
-        return None, None
 
-    point_to_edges = defaultdict(list)
-    for e in remaining:
-        for p in e:
-            point_to_edges[p].append(e)
+class RegionCache:
+    """
+    Best known schedule per region, shared by all pairs of one instance.
+    The key is the region in canonical form: its vertices (sorted, so the local labels
+    0..m-1 are the canonical order), its frozen boundary and the two inner edge
+    sets in local labels. A region seen in the other direction (the two inner sets
+    swapped) is served by reversing the stored schedule.
+    Values are (dist, flips_by_layer, flips_with_partner_by_layer) in global ids,
+    oriented from the first edge set to the second.
+    """
 
-    adj = defaultdict(set)
-    for edges in point_to_edges.values():
-        for i in range(len(edges)):
-            for j in range(i + 1, len(edges)):
-                adj[edges[i]].add(edges[j])
-                adj[edges[j]].add(edges[i])
+    def __init__(self):
+        self.schedules = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kernel):
+        vertices, _, edges_1, edges_2, frozen = kernel
+        border = frozenset(frozen)
+        return (tuple(vertices), tuple(sorted(border)),
+                tuple(sorted(set(edges_1) - border)), tuple(sorted(set(edges_2) - border)))
+
+    @staticmethod
+    def _reversed(key):
+        vertices, border, inner_1, inner_2 = key
+        return vertices, border, inner_2, inner_1
+
+    def find(self, kernel):
+        """The stored schedule for kernel (reversed if needed) or None; not counted."""
+        key = self.key(kernel)
+        if key in self.schedules:
+            return self.schedules[key]
+        back = self.schedules.get(self._reversed(key))
+        if back is None:
+            return None
+        flips, pairs = reverse_schedule(back[2])
+        return back[0], flips, pairs
+
+    def get(self, kernel):
+        result = self.find(kernel)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
 
-    components = []
-    visited = set()
+    def put(self, kernel, result):
+        """Keeps result if it is the first or a shorter schedule for this region."""
+        old = self.find(kernel)
+        if old is None or result[0] < old[0]:
+            self.schedules.pop(self._reversed(self.key(kernel)), None)
+            self.schedules[self.key(kernel)] = result
 
-    for e in remaining:
-        if e in visited:
-            continue
-        comp = set()
-        q = deque([e])
-        visited.add(e)
-        while q:
-            u = q.popleft()
-            comp.add(u)
-            for v in adj[u]:
-                if v not in visited:
-                    visited.add(v)
-                    q.append(v)
-        components.append(comp)
-
-    if len(components) != 2:
-        return None, None
-
-    return (
-        components[0] | barrier,
-        components[1] | barrier
-    )
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = 100 * self.hits / total if total else 0
+        return f"region cache: {self.hits} hits / {self.misses} misses ({rate:.0f}% hit), {len(self.schedules)} regions"
 
 
 # =========================================================
-# 3. תנאי מתי שווה לנסות לחלק
+# 2. distance עם פירוק
 # =========================================================
 
-def should_split_triangulation(T1, T2, shared_edges):
-    total_edges = len(list(T1.get_edges()))
-    if total_edges < 300:
-        return False
-    if len(shared_edges) < 150:
-        return False
-    return True
+def distance_with_split(T1, T2, distance_func=None, workers: int = None, seed: int = None,
+                        cache: RegionCache = None, retries: int = 3):
+    """
+    Splits the pair at its common edges and solves every region independently,
+    in a ProcessPoolExecutor (workers=1 solves them in this process).
+    Regions never share a triangle, so their flips can run side by side:
+    layer i of the result is the union of the regions' layer i and the distance is
+    the largest region distance. distance_func gets (kernel_1, kernel_2, seed=...).
+    cache: regions already in the RegionCache are not solved again.
+    A region whose run fails (see _solve_region) is retried with a new seed up to
+    `retries` times; failed runs are never merged or cached. If a region still has
+    no schedule, the call fails like distance(): (DistanceSolver.max_layers + 1, [], []).
+    """
+    if distance_func is None:
+        distance_func = distance_optimized
+    rng = random.Random(seed)
+    kernels = list(region_kernels(T1, T2))
+    print(f"=== Split into {len(kernels)} regions ===")
+    if not kernels:
+        return 0, [], []
+
+    results = [cache.get(kernel) if cache is not None else None for kernel in kernels]
+    todo = [k for k, r in enumerate(results) if r is None]
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 and len(todo) > 1 else None
+    try:
+        for _ in range(1 + retries):
+            if not todo:
+                break
+            tasks = [(distance_func, *kernels[k], rng.getrandbits(64)) for k in todo]
+            if pool is None or len(tasks) <= 1:
+                solved = [_solve_region(*task) for task in tasks]
+            else:
+                solved = list(pool.map(_solve_region, *zip(*tasks), chunksize=max(1, len(tasks) // 32)))
+            for k, result in zip(todo, solved):
+                results[k] = result
+                if result is not None and cache is not None:
+                    cache.put(kernels[k], result)
+            todo = [k for k in todo if results[k] is None]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if todo:
+        print(f"  * {len(todo)} regions couldent find distance")
+        return DistanceSolver.max_layers + 1, [], []
+
+    flips_by_layer = []
+    flips_with_partner_by_layer = []
+    for d, flips, pairs in results:
+        for i, (layer, layer_pairs) in enumerate(zip(flips, pairs)):
+            if i == len(flips_by_layer):
+                flips_by_layer.append(set())
+                flips_with_partner_by_layer.append(set())
+            flips_by_layer[i] |= layer
+            flips_with_partner_by_layer[i] |= layer_pairs
+    return max(d for d, _, _ in results), flips_by_layer, flips_with_partner_by_layer
 
 
 # =========================================================
-# 4. distance עם ניסיון חלוקה
+# 3. distance מהיר (active edges)
 # =========================================================
 
-def distance_with_split(T1, T2, distance_func):
-    list_T1 = set(normalize_edge(*e) for e in T1.get_edges())
-    list_T2 = set(normalize_edge(*e) for e in T2.get_edges())
-    shared_edges = list_T1 & list_T2
-
-    print("\n=== Split Analysis ===")
-    print(f"Total edges: {len(list_T1)}")
-    print(f"Shared edges: {len(shared_edges)}")
+class OptimizedDistanceSolver(DistanceSolver):
+    """DistanceSolver that only rescores the edges touched by the previous layer."""
 
-    if not should_split_triangulation(T1, T2, shared_edges):
-        print("→ NOT splitting")
-        return distance_func(T1, T2)
+    def solve(self):
+        U = self.U
+        dist = 0
+        flips_by_layer = []
+        flips_with_partner_by_layer = []
 
-    print("→ Searching separator...")
-    barrier = find_barrier_path_fast(shared_edges)
+        lista = [U.intern(*e) for e in self.a.get_edges()]
+        listb = [U.intern(*e) for e in self.b.get_edges()]
+        set_b = set(listb)
 
-    if barrier is None:
-        print("→ No separator found")
-        return distance_func(T1, T2)
+        a_working = as_backend(self.a, self.backend).fork()
 
-    T1_l, T1_r = split_by_connected_components(T1, barrier)
-    T2_l, T2_r = split_by_connected_components(T2, barrier)
+        changed = ChangedEdgeTracker(lista, set_b)
+        setChangedEdges = changed.edges
+        active_edges = setChangedEdges.copy()
 
-    if T1_l is None or T2_l is None:
-        print("→ Split failed")
-        return distance_func(T1, T2)
+        while changed.mismatch:
+            if dist > self.max_layers:
+                break
 
-    print(f"✓ Split success: {len(T1_l)} | {len(T1_r)}")
+            setFlips = set()
+            setFlipsWithPartner = set()
+            new_active = set()
 
-    pts = T1._flip_map.points
+            for e in list(active_edges):
+                if e not in setChangedEdges:
+                    continue
+                try:
+                    if is_free(a_working, set_b, e, U):
+                        flip_rev = U.partner_id(a_working, e)
+                        a_working.add_flip(U.edge(e))
+                        setFlips.add(e)
+                        setFlipsWithPartner.add((e, flip_rev))
+                        new_active.add(flip_rev)
+                        self.free_flips += 1
+                except ValueError:
+                    continue
 
-    try:
-        TL1 = FlippableTriangulation.from_points_edges(pts, list(T1_l))
-        TR1 = FlippableTriangulation.from_points_edges(pts, list(T1_r))
-        TL2 = FlippableTriangulation.from_points_edges(pts, list(T2_l))
-        TR2 = FlippableTriangulation.from_points_edges(pts, list(T2_r))
+            h_flips, h_pairs, h_active = Heuristic_optimized(
+                a_working, set_b, active_edges, setChangedEdges, self.lastFlips, self.k, U, self.score_cache
+            )
+            self.heuristic_flips += len(h_flips)
 
-        d1, f1, p1 = distance_func(TL1, TL2)
-        d2, f2, p2 = distance_func(TR1, TR2)
+            setFlips |= h_flips
+            setFlipsWithPartner |= h_pairs
+            new_active |= h_active
 
-        return d1 + d2, f1 + f2, p1 + p2
+            self.lastFlips = setFlips.copy()
+            a_working.commit()
 
-    except Exception as e:
-        print("→ Fallback:", e)
-        return distance_func(T1, T2)
+            flips_by_layer.append(U.edges(setFlips))
+            flips_with_partner_by_layer.append({(U.edge(e), U.edge(f)) for e, f in setFlipsWithPartner})
+            dist += 1
 
+            changed.commit(setFlipsWithPartner)
+            if self.score_cache is not None:
+                self.score_cache.invalidate(setFlipsWithPartner)
 
-# =========================================================
-# 5. distance מהיר (active edges)
-# =========================================================
+            if len(setChangedEdges) < 50:
+                active_edges = setChangedEdges.copy()
+            else:
+                active_edges = new_active & setChangedEdges
 
-def distance_optimized(a: FlippableTriangulation,
-                       b: FlippableTriangulation):
+        self.layers = dist
+        return dist, flips_by_layer, flips_with_partner_by_layer
 
-    edge_attempt_count.clear()
-    k = 16
-    dist = 0
-    flips_by_layer = []
-    flips_with_partner_by_layer = []
 
-    lista = [normalize_edge(*e) for e in a.get_edges()]
-    listb = [normalize_edge(*e) for e in b.get_edges()]
-    set_b = set(listb)
-
-    a_working = a.fork()
-    lastFlips = set()
-
-    setChangedEdges = set(diff(lista, listb))
-    active_edges = setChangedEdges.copy()
-
-    while not a_working.__eq__(b):
-        if dist > 400:
-            break
-
-        setFlips = set()
-        setFlipsWithPartner = set()
-        new_active = set()
-
-        for e in list(active_edges):
-            if e not in setChangedEdges:
-                continue
-            try:
-                if isFree(a_working, set_b, e):
-                    flip_rev = normalize_edge(*a_working.get_flip_partner(e))
-                    a_working.add_flip(e)
-                    setFlips.add(e)
-                    setFlipsWithPartner.add((e, flip_rev))
-                    new_active.add(flip_rev)
-            except ValueError:
-                continue
-
-        h_flips, h_pairs, h_active = Heuristic_optimized(
-            a_working, set_b, active_edges, setChangedEdges, lastFlips, k
-        )
-
-        setFlips |= h_flips
-        setFlipsWithPartner |= h_pairs
-        new_active |= h_active
-
-        lastFlips = setFlips.copy()
-        a_working.commit()
-
-        flips_by_layer.append(setFlips)
-        flips_with_partner_by_layer.append(setFlipsWithPartner)
-        dist += 1
-
-        setChangedEdges = {
-            normalize_edge(*e)
-            for e in a_working.get_edges()
-            if normalize_edge(*e) not in set_b
-        }
-
-        if len(setChangedEdges) < 50:
-            active_edges = setChangedEdges.copy()
-        else:
-            active_edges = new_active & setChangedEdges
-
-    return dist, flips_by_layer, flips_with_partner_by_layer
+def distance_optimized(a: FlippableTriangulation,
+                       b: FlippableTriangulation,
+                       backend: str = "flippable",
+                       cache_scores: bool = True,
+                       universe: EdgeUniverse = None,
+                       seed: int = None):
+    """Thin wrapper around OptimizedDistanceSolver."""
+    return OptimizedDistanceSolver(a, b, backend, cache_scores, universe, seed).solve()
 
 
 # =========================================================
-# 6. Heuristic מתוקן (אין יותר None!)
+# 4. Heuristic מתוקן (אין יותר None!)
 # =========================================================
 
-def Heuristic_optimized(a, set_b, active_edges, setChangedEdges, lastFlips, k):
-    edge_by_score = []
+def Heuristic_optimized(a, set_b, active_edges, setChangedEdges, lastFlips, k, U, cache=None):
     to_Flip = set()
     setFlipsWithPartner = set()
     new_active = set()
 
     edges_to_check = active_edges & setChangedEdges
 
-    for e in edges_to_check:
-        try:
-            score = blocking_edges(a, set_b, {e}, k)
-            if score is not None:
-                edge_by_score.append((e, score))
-        except ValueError:
-            continue
+    edge_by_score = scored_edges(a, set_b, edges_to_check, k, U, cache)
 
     if not edge_by_score:
         return set(), set(), set()
 
     best_edge, best_score = max(edge_by_score, key=lambda x: x[1])
 
+    flips = flip_set(a)
     for e, score in edge_by_score:
         if score <= 0 or e in lastFlips or e in set_b:
             continue
         try:
-            flip_rev = normalize_edge(*a.get_flip_partner(e))
-            if e in a.possible_flips():
-                a.add_flip(e)
+            flip_rev = U.partner_id(a, e)
+            if U.edge(e) in flips:
+                a.add_flip(U.edge(e))
                 to_Flip.add(e)
                 setFlipsWithPartner.add((e, flip_rev))
                 new_active.add(flip_rev)
@@ -288,156 +299,13 @@ def Heuristic_optimized(a, set_b, active_edges, setChangedEdges, lastFlips, k):
 
 
 # =========================================================
-# 7. הפונקציה הראשית
+# 5. הפונקציה הראשית
 # =========================================================
 
 def distance_super_optimized(T1, T2):
     return distance_with_split(T1, T2, distance_optimized)
 
 
-# =========================================================
-# 8. blocking_edges – נשאר שלך
-# =========================================================
-
-def Huristic(
-    a: FlippableTriangulation,
-    set_b: set[tuple[int, int]],
-    setChangedEdges: set[tuple[int, int]],
-    lastFlips: set[tuple[int, int]],
-    k: int
-) -> tuple[set, set, set]:  # מחזיר גם toRemove וגם toAdd
-       
-    edge_by_score = []
-    to_Flip = set()
-    toRemove = set()
-    toAdd = set()
-    setFlipsWithPartner = set()
-    
-    for e in set(setChangedEdges):
-        try:
-            score = blocking_edges(a, set_b, {e}, k)
-            edge_by_score.append((e, score))
-        except ValueError:
-            continue
-    if not edge_by_score:
-      return set(), set(), set(), set()
-
-    best_edge, best_score = max(edge_by_score, key=lambda x: x[1])
-
-    for e, score in edge_by_score:
-        try:
-            flip_rev = normalize_edge(*a.get_flip_partner(e))
-            if e in a.possible_flips() and flip_rev not in lastFlips:
-                if (score > 0) and e not in set_b:
-                    a.add_flip(e) 
-                    to_Flip.add(e)
-                    toRemove.add(e)
-                    toAdd.add(flip_rev)
-                    setFlipsWithPartner.add((e,flip_rev))
-                    edge_attempt_count[flip_rev] = 1 + edge_attempt_count[e]
-        except ValueError:
-            continue
-                         
-    if best_score == 0 or len(setChangedEdges)> 100:
-        candidates = [e for e in setChangedEdges if e not in set_b and e not in lastFlips]
-        for e in candidates:
-            if edge_attempt_count[e] == 0:
-                try:
-                    e = random.choice(candidates)
-                    flip_rev = normalize_edge(*a.get_flip_partner(e))
-                    a.add_flip(e)  
-                    to_Flip.add(e)
-                    toRemove.add(e)
-                    toAdd.add(flip_rev)
-                    setFlipsWithPartner.add((e,flip_rev))
-                    edge_attempt_count[flip_rev] = 1 + edge_attempt_count[e]
-                except:
-                    pass
-
-    return to_Flip, toRemove, toAdd ,setFlipsWithPartner
-def blocking_edges(a: FlippableTriangulation, 
-                   set_b: set[tuple[int, int]],
-                   edges: set[tuple[int,int]], 
-                   k: int) -> int:
-    """
-    מחשב כמה edges חופשיים ניתן להגיע אליהם מ-edges נתון
-    """
-    if k == 0 or not edges:
-        return 0
-    
-    a_temp = a.fork()
-    
-    edge_to_partner = {}
-    successful_flips = []
-    
-    for edge in edges:
-        try:
-            partner = a_temp.get_flip_partner(edge)
-            edge_to_partner[edge] = partner
-            if edge in a.possible_flips():
-                a_temp.add_flip(edge)
-                successful_flips.append(edge)
-        except ValueError:
-            continue
-    
-    if not successful_flips:
-        return 0
-    
-    a_temp.commit()
-    
-    free_edges = set()
-    blocked_edges = set()
-    visited = set(edges) | set_b  
-    triangles = []
-    for edge in successful_flips:
-        partner = edge_to_partner[edge]
-        t1, t2 = new_triangles(a_temp, partner)
-        triangles.append(t1)
-        triangles.append(t2)
-        for triangle in [t1, t2]:
-            for e in triangle:
-                e_norm = normalize_edge(*e)
-                
-                if e_norm in visited:
-                    continue
-                
-                visited.add(e_norm)
-                
-                if e_norm not in a_temp.possible_flips():
-                    continue
-                
-                if isFree(a_temp, set_b, e_norm):
-                    free_edges.add(e_norm)
-                else:
-                    blocked_edges.add(e_norm)
-    
-    score = len(free_edges)
-    for e in blocked_edges:
-        if e not in free_edges and e  not in set_b and e in a_temp.possible_flips():
-            try:
-                a_dup = a_temp.fork()
-                a_dup.add_flip(e)
-                a_dup.commit()
-                t1, t2 = new_triangles(a,e)
-                for triangle in [t1, t2]:
-                    for e1 in triangle: 
-                       e_norm = normalize_edge(*e1)
-                       if isFree(a_dup, set_b, e_norm):
-                         free_edges.add(e_norm)
-
-            except ValueError:
-                continue
-    if not free_edges:       
-        for edge in blocked_edges:
-            e_norm = normalize_edge(*edge)
-            if e_norm in a_temp.possible_flips() and e_norm not in set_b:
-                free_edges.add(e_norm)
-
-
-    if free_edges:
-        recursive_score = blocking_edges(a_temp, set_b, free_edges, k - 1)
-        score += recursive_score 
-    return score
 # ===========================
 # דוגמה לשימוש
 # ===========================
@@ -450,7 +318,7 @@ d, flips, partner = distance(T1, T2)
 d, flips, partner = distance_super_optimized(T1, T2)
 
 # זה יעשה:
-# 1. ינסה לחלק לשתי טריאנגולציות (אם יש הרבה צלעות משותפות)
-# 2. אם הצליח - ירוץ distance_optimized על כל חצי בנפרד
-# 3. אם לא הצליח - ירוץ distance_optimized רגיל
+# 1. יפרק לאזורים לפי הקשתות המשותפות
+# 2. ירוץ distance_optimized על כל אזור בנפרד (במקביל, בתהליכים)
+# 3. יאחד את השכבות לפי אינדקס - המרחק הוא המקסימום על האזורים
 """
\ No newline at end of file
@@ -0,0 +1,90 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from cgshop2026_pyutils.geometry import FlippableTriangulation
+
+from helpFuncs import normalize_edge, reconstruct_triangulation_sequence, schedule_pairs
+from halfedge import HalfEdgeTriangulation, coords_of
+from fpt_distance import fpt_distance
+
+
+# =========================================================
+# שיפור מקומי: פתרון מדויק מחדש של חלונות קצרים בלוח הזמנים
+# =========================================================
+
+def _solve_window(xy: list[tuple[int, int]], edges_start: list[tuple[int, int]],
+                  edges_end: list[tuple[int, int]], max_k: int, max_nodes: int, deadline: float):
+    """
+    Exact schedule between the two boundary triangulations of one window, at most
+    max_k layers (fpt_distance: common edges kept, every region solved exactly).
+    deadline is a time.time() value, so it means the same in a worker process.
+    Returns flips_by_layer or None. Only coordinates and edge lists are pickled.
+    """
+    left = deadline - time.time()
+    if left <= 0:
+        return None
+    a = HalfEdgeTriangulation.from_points_edges(xy, edges_start)
+    b = HalfEdgeTriangulation.from_points_edges(xy, edges_end)
+    result = fpt_distance(a, b, max_k=max_k, max_nodes=max_nodes, time_limit=left)
+    return None if result is None else result[1]
+
+
+def optimize_windows(a: FlippableTriangulation,
+                     flips_by_layer,
+                     w: int = 5,
+                     time_budget: float = 10.0,
+                     workers: int = 1,
+                     max_nodes: int = 20_000):
+    """
+    Local improvement of a schedule (from distance / fromCompToFlips): the
+    triangulations at the borders of w consecutive layers come from
+    reconstruct_triangulation_sequence, the segment between them is solved exactly
+    with at most w - 1 layers, and it is replaced when that succeeds.
+    One round covers the schedule with disjoint windows, which are independent and
+    go to a ProcessPoolExecutor (workers=None uses every core, 1 runs here); every
+    round moves the windows by one layer, so after w rounds every window position
+    was tried. Stops after w rounds in a row without an improvement or when
+    time_budget (seconds) is used up; the exact searches get the same deadline, so
+    a running window stops too (besides its max_nodes bound).
+    Returns (dist, flips_by_layer, flips_with_partner_by_layer).
+    """
+    xy = coords_of(a)
+    layers = [{normalize_edge(*e) for e in layer} for layer in flips_by_layer]
+    deadline = time.time() + time_budget
+    offset = 0
+    idle = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        while idle < w and time.time() < deadline and len(layers) >= w:
+            states = [t.get_edges() for t in reconstruct_triangulation_sequence(a, layers)]
+            starts = list(range(offset, len(layers) - w + 1, w))
+            tasks = [(xy, states[i], states[i + w], w - 1, max_nodes, deadline) for i in starts]
+            results = [None] * len(tasks)
+            if pool is None:
+                for k, task in enumerate(tasks):
+                    if time.time() >= deadline:
+                        break
+                    results[k] = _solve_window(*task)
+            else:
+                futures = [pool.submit(_solve_window, *task) for task in tasks]
+                for k, f in enumerate(futures):
+                    try:
+                        results[k] = f.result(timeout=max(0.0, deadline - time.time()))
+                    except TimeoutError:
+                        for g in futures[k:]:
+                            g.cancel()
+                        break
+
+            improved = False
+            # מחליפים מהסוף להתחלה כדי שהאינדקסים של החלונות הקודמים לא יזוזו
+            for i, new_layers in reversed(list(zip(starts, results))):
+                if new_layers is not None and len(new_layers) < w:
+                    layers[i:i + w] = [set(layer) for layer in new_layers]
+                    improved = True
+            idle = 0 if improved else idle + 1
+            offset = (offset + 1) % w
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    return len(layers), layers, schedule_pairs(a, layers)